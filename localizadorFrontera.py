@@ -0,0 +1,164 @@
+"""
+ Clases:
+  Auxiliares:
+  localizadorFrontera : Clase que localiza los puntos 2D (lat,lon) de una frontera de la mascara en la malla
+                        del archivo fuente, con un KD-tree sobre los puntos (lat,lon) de mercator.
+                        Funciona con mallas regulares, curvilineas o rotadas, tanto en la mascara como en el
+                        archivo fuente. Se construye una vez por corrida, y se reutiliza para todas las
+                        variables y registros temporales.
+"""
+
+import logging as log
+import numpy as np
+from scipy import spatial
+
+
+def latLonToXYZ(lat, lon):
+    """
+     Convierte coordenadas (lat,lon) en grados a puntos (x,y,z) sobre la esfera unitaria.
+     Asi las distancias del KD-tree no dependen de la latitud ni del corte en longitud.
+    """
+    rlat = np.radians(np.asarray(lat,float).ravel())
+    rlon = np.radians(np.asarray(lon,float).ravel())
+    return np.column_stack((np.cos(rlat)*np.cos(rlon), np.cos(rlat)*np.sin(rlon), np.sin(rlat)))
+
+
+class localizadorFrontera():
+        """
+         Clase localizadorFrontera
+         Para cada punto de la frontera encuentra sus 'nVecinos' puntos mas cercanos de la malla del
+         archivo fuente y sus pesos, y el nivel mas cercano del archivo fuente para cada profundidad
+         de la mascara.
+          sMetodo :
+            'nearest' : Toma el vecino valido (oceano) mas cercano.
+            'idw'     : Promedio de los vecinos validos, pesado con el inverso de la distancia al cuadrado.
+
+         Atributos:
+          regiones    : Lista de tiras (depth,lat,lon) sin el eje temporal que contienen a los vecinos,
+                        una por renglon (o columna) de la malla del archivo fuente, limitada al rango de
+                        vecinos de ese renglon. Es lo que se lee del archivo fuente en cada bloque (ver leer).
+          shapeRegion : Dimensiones (depth,columnas) de lo que se lee por registro, todas las tiras juntas.
+        """
+
+        def __init__(self, ncMerLat, ncMerLon, ncMerDepth, fronteraLat, fronteraLon, ncMaskDepth, nVecinos=4, sMetodo='nearest', fMargen=1.0):
+            """
+             ncMerLat, ncMerLon : Coordenadas del archivo fuente, 1D (malla regular) o 2D (curvilinea)
+             fronteraLat, fronteraLon : Coordenadas 1D de los puntos de la frontera en la mascara
+             fMargen : Margen en grados alrededor de la frontera, para los puntos del archivo fuente
+                       que entran en el KD-tree.
+            """
+            if sMetodo not in ['nearest','idw']:
+                raise ValueError('localizadorFrontera: Metodo no valido: ' + str(sMetodo))
+            if nVecinos < 1 or nVecinos > 32:
+                raise ValueError('localizadorFrontera: nVecinos debe estar entre 1 y 32')
+            self.sMetodo = sMetodo
+            self.nVecinos = nVecinos
+            fronteraLat = np.asarray(fronteraLat,float).ravel()
+            fronteraLon = np.asarray(fronteraLon,float).ravel()
+
+            # Malla 2D del archivo fuente
+            merLat = np.asarray(ncMerLat,float)
+            merLon = np.asarray(ncMerLon,float)
+            if merLat.ndim == 1:
+                merLon, merLat = np.meshgrid(merLon, merLat)
+
+            # Solo los puntos cerca de la frontera entran al KD-tree
+            candidatos = ((merLat >= fronteraLat.min() - fMargen) & (merLat <= fronteraLat.max() + fMargen) &
+                          (merLon >= fronteraLon.min() - fMargen) & (merLon <= fronteraLon.max() + fMargen))
+            jCand, iCand = np.nonzero(candidatos)
+            if jCand.size < nVecinos:
+                raise ValueError('localizadorFrontera: La frontera esta fuera del dominio del archivo fuente')
+            log.info('localizadorFrontera: KD-tree con ' + str(jCand.size) + ' puntos del archivo fuente')
+            tree = spatial.cKDTree(latLonToXYZ(merLat[jCand,iCand], merLon[jCand,iCand]))
+            dist, iVecino = tree.query(latLonToXYZ(fronteraLat, fronteraLon), k=nVecinos)
+            if nVecinos == 1:
+                dist = dist[:,None]
+                iVecino = iVecino[:,None]
+
+            # Tiras del archivo fuente que contienen a los vecinos. En una malla rotada o curvilinea el
+            # rectangulo que contiene a todos los vecinos cubre casi todo el subdominio, por eso se lee
+            # cada renglon (o columna, lo que de menos tiras) solo en el rango de sus vecinos.
+            jVecino = jCand[iVecino]
+            iVecino = iCand[iVecino]
+            lRenglones = self._tiras(jVecino, iVecino)
+            lColumnas = self._tiras(iVecino, jVecino)
+            if len(lColumnas[0]) < len(lRenglones[0]):
+                uTira, iPrimero, iUltimo = lColumnas
+                self.regiones = [(slice(None), slice(a,b+1), u) for u, a, b in zip(uTira, iPrimero, iUltimo)]
+                iTira, iDentro = np.searchsorted(uTira, iVecino), jVecino
+            else:
+                uTira, iPrimero, iUltimo = lRenglones
+                self.regiones = [(slice(None), u, slice(a,b+1)) for u, a, b in zip(uTira, iPrimero, iUltimo)]
+                iTira, iDentro = np.searchsorted(uTira, jVecino), iVecino
+            # Posicion de cada tira en el bloque leido, y de cada vecino (nPuntos,nVecinos) en el bloque
+            nLargo = iUltimo - iPrimero + 1
+            iInicio = np.concatenate(([0], np.cumsum(nLargo)[:-1]))
+            self.iColumna = iInicio[iTira] + iDentro - iPrimero[iTira]
+            self.shapeRegion = (np.size(ncMerDepth), int(nLargo.sum()))
+            # Pesos por inverso de la distancia, ordenados del vecino mas cercano al mas lejano
+            self.pesos = 1.0 / np.maximum(dist, 1e-12)**2
+
+            # Nivel del archivo fuente mas cercano a cada profundidad de la mascara
+            self.iDepth = np.argmin(np.abs(np.asarray(ncMerDepth,float)[None,:] - np.asarray(ncMaskDepth,float)[:,None]), axis=1)
+
+        def _tiras(self, aTira, aDentro):
+            """
+             Agrupa los vecinos por el indice 'aTira' (renglon o columna). Regresa los indices de tira
+             unicos, y el primer y ultimo indice 'aDentro' de los vecinos en cada tira.
+            """
+            uTira = np.unique(aTira)
+            iPrimero = np.array([aDentro[aTira == u].min() for u in uTira])
+            iUltimo = np.array([aDentro[aTira == u].max() for u in uTira])
+            return uTira, iPrimero, iUltimo
+
+        def leer(self, ncVar, tSlice):
+            """
+             Lee de la variable 'ncVar' (t,depth,lat,lon) del archivo fuente los registros 'tSlice' de
+             todas las tiras. Regresa un bloque (t,depth,columnas) para el metodo interpolar.
+            """
+            return np.ma.concatenate([np.ma.asarray(ncVar[(tSlice,) + region]) for region in self.regiones], axis=-1)
+
+        def bytesPorRegistro(self):
+            """
+             Memoria temporal aproximada (bytes) de interpolar un registro temporal.
+            """
+            nPuntos = self.iColumna.shape[0]
+            return self.shapeRegion[0] * nPuntos * self.nVecinos * (8 + 1) * 2 + (self.shapeRegion[0] + self.iDepth.size) * nPuntos * 8
+
+        def interpolar(self, bloque):
+            """
+             Interpola un bloque (t,depth,columnas) leido con el metodo 'leer' a los puntos de la
+             frontera y a las profundidades de la mascara. Regresa un arreglo (t,depthMascara,nPuntos)
+             Los puntos sin vecinos validos toman el valor del nivel de arriba, o el del punto valido mas
+             cercano sobre la frontera.
+            """
+            bloque = np.ma.asarray(bloque)
+            # Vecinos de cada punto: (t,depth,nPuntos,nVecinos)
+            valores = bloque.data[:,:,self.iColumna].astype(float)
+            validos = ~np.ma.getmaskarray(bloque)[:,:,self.iColumna]
+
+            if self.sMetodo == 'nearest':
+                iPrimero = np.argmax(validos, axis=-1)
+                horizontal = np.choose(iPrimero, np.rollaxis(valores,-1))
+            else:
+                w = self.pesos[None,None,:,:] * validos
+                wSum = w.sum(axis=-1)
+                horizontal = (w * np.where(validos, valores, 0)).sum(axis=-1) / np.where(wSum > 0, wSum, 1)
+            horizontal[~validos.any(axis=-1)] = np.nan
+
+            # Rellenar hacia abajo con el nivel de arriba
+            for z in range(1, horizontal.shape[1]):
+                faltan = np.isnan(horizontal[:,z,:])
+                horizontal[:,z,:][faltan] = horizontal[:,z-1,:][faltan]
+            # Rellenar sobre la frontera con el punto valido mas cercano
+            faltan = np.isnan(horizontal)
+            if faltan.any():
+                for t, z in zip(*np.nonzero(faltan.any(axis=-1))):
+                    iValidos = np.nonzero(~faltan[t,z,:])[0]
+                    if iValidos.size == 0:
+                        horizontal[t,z,:] = 0
+                        continue
+                    iFaltan = np.nonzero(faltan[t,z,:])[0]
+                    horizontal[t,z,iFaltan] = horizontal[t,z,iValidos[np.argmin(np.abs(iFaltan[:,None] - iValidos[None,:]), axis=1)]]
+
+            return horizontal[:,self.iDepth,:]
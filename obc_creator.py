@@ -16,15 +16,27 @@
               o datos en estructura mensual o anual.
 
  Jan-14-2015 : Primer cambio 2015
+ Oct-19-2026 : Parametros 'iTimeRange' y 'sPeriodo' en 'crearFronterasEsteSur' para procesar solo
+               un periodo (con sus registros de borde), usados por el driver en paralelo obc_parallel.py
+             : Parametros 'nTimeChunk' y 'nPrefetch', se interpola y salva por bloques temporales
+               para limitar la memoria utilizada.
+             : Los puntos 2D de las fronteras se localizan en la malla del archivo fuente con un KD-tree
+               (localizadorFrontera.py), para mallas curvilineas o rotadas. Se elimino
+               'interpIrregularGridToRegular' (griddata), que ya no se utiliza.
+             : Parametros 'dMascara' y 'dLoc' para reutilizar la mascara y los localizadores (obc_service.py)
+             : Funciones 'verificarDirectorioSalida' y 'verificarSalida', netcdfFile solo reporta los errores
+               al crear los archivos, los procesos del driver y del servicio fallan si no se crearon.
 """
 
+import os
 import numpy as np
 import netCDF4 as nc 
 import logging as log 
 import datetime as dt 
-from scipy import interpolate
+import itertools
 # own libs
 import netcdfFile
+import localizadorFrontera
 
 def dateToNemoCalendar(data, ctype='gregorian',give='full'):
     """ 
@@ -84,28 +96,128 @@ def dateToNemoCalendar(data, ctype='gregorian',give='full'):
     return np.squeeze(newc) 
 
 
-def interpIrregularGridToRegular(xgrid, ygrid, zdata, xgridnew, ygridnew, imethod='linear'):
+def clavePeriodo(tval_datetime, sFilesSize='yearly'):
     """
-     Funcion para interpolar una seccion 2D zdata[:,:] con puntos validos en 
-     el conjunto de coordenadas xgrid[:],ygrid[:] a una nueva malla 2D con 
-     dimensiones xgridnew, ygridnew.
-     Se utiliza el metodo de numpy griddata para realizar la operacion.
+     Regresa la clave del periodo (anual o mensual) al que pertenece la fecha 'tval_datetime'.
+     Es la misma que se utiliza como sufijo de los archivos de salida: 
+      yearly  : 'y2014m00'
+      monthly : 'y2014m07'
     """
-    # Obtener los puntos de la malla de zdata donde los valores 
-    # no tengan mascara, es decir solo oceano.
-    xdata_valid = np.array([])
-    ydata_valid = np.array([]) 
-    pointdata   = np.array([])
-    for i in range(xgrid.size):
-        for j in range(ygrid.size):
-            if (not (zdata[i,j] is np.ma.masked)):
-                xdata_valid = np.append(xdata_valid,xgrid[i]) # 
-                ydata_valid = np.append(ydata_valid,ygrid[j]) #  
-                pointdata = np.append(pointdata,zdata[i,j]) 
-    # Crear la malla regular, con el metodo griddata, que a partir de la lista de puntos pointdata (X=xdata_valid,Y=ydata_valid) , va a generar la malla 
-    # con X = ygridnew[None,:] Y = xgridnew[:,None] 
-    newZdata = interpolate.griddata((ydata_valid,xdata_valid), pointdata, (ygridnew[None,:],xgridnew[:,None]), method=imethod) 
-    return newZdata 
+    if sFilesSize == 'yearly':
+        return 'y' + str(tval_datetime.year) + 'm00'
+    else:
+        return 'y' + str(tval_datetime.year) + 'm' + ("%02d"%tval_datetime.month)
+
+
+def archivosPeriodo(fileOutPrefix, sPeriodo):
+    """
+     Regresa la lista de archivos OBC (saveMethod 2) del periodo 'sPeriodo' (ver clavePeriodo).
+    """
+    return [fileOutPrefix + '_' + sFrontera + '_' + sTipo + '_' + sPeriodo + '.nc' for sFrontera in ['east','south'] for sTipo in ['TS','U','V']]
+
+
+def periodosFuente(dataSourceFile, sFilesSize='yearly'):
+    """
+     Regresa la lista de periodos (ver clavePeriodo) de los registros temporales del archivo fuente,
+     en orden y sin repetir.
+    """
+    ncMer = nc.Dataset(dataSourceFile,'r')
+    ncMerTime = ncMer.variables['time_counter']
+    dates = nc.num2date(ncMerTime[:],ncMerTime.units,ncMerTime.calendar)
+    ncMer.close()
+    lPeriodos = []
+    for tval_datetime in dates:
+        sPeriodo = clavePeriodo(tval_datetime,sFilesSize)
+        if sPeriodo not in lPeriodos:
+            lPeriodos.append(sPeriodo)
+    return lPeriodos
+
+
+def verificarDirectorioSalida(fileOutPrefix):
+    """
+     Lanza IOError si el directorio de 'fileOutPrefix' no existe o no se puede escribir en el.
+     netcdfFile solo reporta el error al crear los archivos, y la corrida terminaria sin salida.
+    """
+    sDir = os.path.dirname(os.path.abspath(fileOutPrefix))
+    if not os.path.isdir(sDir) or not os.access(sDir, os.W_OK | os.X_OK):
+        raise IOError('verificarDirectorioSalida: No se puede escribir en el directorio de salida: ' + sDir)
+
+
+def verificarSalida(fileOutPrefix, lPeriodos):
+    """
+     Lanza IOError si falta alguno de los archivos OBC (saveMethod 2) de los periodos 'lPeriodos'.
+    """
+    lFaltan = [f for sPeriodo in lPeriodos for f in archivosPeriodo(fileOutPrefix,sPeriodo) if not os.path.isfile(f)]
+    if len(lFaltan) > 0:
+        raise IOError('verificarSalida: No se crearon los archivos: ' + ', '.join(lFaltan))
+
+
+def cargarMascara(sMaskFile, iEastIndex, iSouthIndex):
+    """
+     Carga del archivo de mascara 'sMaskFile' las coordenadas de la malla y la mascara de las
+     rebanadas de la frontera este (columna 'iEastIndex') y sur (renglon 'iSouthIndex').
+     Regresa <python dict> : { 'nav_lat' , 'nav_lon' , 'nav_lev' , 'tmaskEast' (z,y) , 'tmaskSouth' (z,x) }
+    """
+    ncMask = nc.Dataset(sMaskFile,'r')
+    dMascara = {}
+    dMascara['nav_lat'] = ncMask.variables['nav_lat'][:]
+    dMascara['nav_lon'] = ncMask.variables['nav_lon'][:]
+    dMascara['nav_lev'] = ncMask.variables['nav_lev'][:]
+    dMascara['tmaskEast'] = ncMask.variables['tmask'][0,:,:,iEastIndex] 
+    dMascara['tmaskSouth'] = ncMask.variables['tmask'][0,:,iSouthIndex,:] 
+    ncMask.close() 
+    return dMascara
+
+
+def localizarFronteras(ncMerLat, ncMerLon, ncMerDepth, ncMaskLat, ncMaskLon, ncMaskDepth, iEastIndex, iSouthIndex, nVecinos=4, sMetodo='nearest'):
+    """
+     Construye los localizadores (ver localizadorFrontera.py) de la frontera este (columna 'iEastIndex'
+     de la mascara) y sur (renglon 'iSouthIndex'), con los puntos 2D (lat,lon) de cada frontera.
+     Regresa <python dict> : { 'east' : localizadorFrontera , 'south' : localizadorFrontera }
+    """
+    dLoc = {}
+    dLoc['east'] = localizadorFrontera.localizadorFrontera(ncMerLat,ncMerLon,ncMerDepth,ncMaskLat[:,iEastIndex],ncMaskLon[:,iEastIndex],ncMaskDepth,nVecinos,sMetodo)
+    dLoc['south'] = localizadorFrontera.localizadorFrontera(ncMerLat,ncMerLon,ncMerDepth,ncMaskLat[iSouthIndex,:],ncMaskLon[iSouthIndex,:],ncMaskDepth,nVecinos,sMetodo)
+    return dLoc
+
+
+def chunksEnRegiones(ncVar, dRegiones):
+    """
+     Regresa el numero de chunks (netCDF4/HDF5) distintos de la variable 'ncVar' (t,z,y,x) que se tocan
+     al leer un registro temporal de las regiones 'dRegiones' (<python dict> por frontera con la lista
+     de rebanadas (depth,lat,lon), ver localizadorFrontera.regiones).
+     Regresa 0 si la variable no tiene chunks (contiguous).
+    """
+    chunking = ncVar.chunking()
+    if chunking == 'contiguous' or chunking == None:
+        return 0
+    sChunks = set()
+    for lRegiones in dRegiones.values():
+        for region in lRegiones:
+            lRangos = []
+            for sel, dimSize, chunkSize in zip(region, ncVar.shape[1:], chunking[1:]):
+                if isinstance(sel, slice):
+                    first, last, step = sel.indices(dimSize)
+                    lRangos.append(range(first//chunkSize, (last-1)//chunkSize + 1))
+                else:
+                    lRangos.append([int(sel)//chunkSize])
+            sChunks.update(itertools.product(*lRangos))
+    return len(sChunks)
+
+
+def configurarCacheFuente(ncVar, dRegiones, nPrefetch):
+    """
+     Ajusta la cache de chunks de la variable 'ncVar' del archivo fuente para que mantenga 
+     'nPrefetch' filas (en el eje temporal) de los chunks que cubren las regiones de las fronteras.
+     Asi, al leer bloques temporales mas cortos que el chunk temporal del archivo, los chunks
+     no se descomprimen de nuevo en cada bloque. Regresa el tamano de la cache en bytes.
+    """
+    nChunks = chunksEnRegiones(ncVar, dRegiones)
+    if nChunks == 0 or nPrefetch <= 0:
+        return 0
+    nBytes = int(nPrefetch * nChunks * np.prod(ncVar.chunking()) * ncVar.dtype.itemsize)
+    ncVar.set_var_chunk_cache(size=nBytes, nelems=nPrefetch*nChunks*4+1)
+    return nBytes
 
 
 def applyMask(zData,mask):
@@ -118,7 +230,7 @@ def applyMask(zData,mask):
     return zDataMasked.filled()  
 
 
-def crearFronterasEsteSur(dataSourceFile,sMaskFile,iEastIndex=-1,iSouthIndex=1, fileOutPrefix = 'obc_', saveMethod = 1, sFilesSize = 'yearly'):  
+def crearFronterasEsteSur(dataSourceFile,sMaskFile,iEastIndex=-1,iSouthIndex=1, fileOutPrefix = 'obc_', saveMethod = 1, sFilesSize = 'yearly', iTimeRange = None, sPeriodo = None, nTimeChunk = None, nPrefetch = 0, nVecinos = 4, sMetodoHorizontal = 'nearest', dMascara = None, dLoc = None):  
     """
      Script para crear archivos OBC - Entrada simulacion NEMO-OPA 
      En especifico para archivos frontera Este y Sur.
@@ -134,6 +246,23 @@ def crearFronterasEsteSur(dataSourceFile,sMaskFile,iEastIndex=-1,iSouthIndex=1,
        1 : Salva los datos interpolados en archivos netcdf. 
        2 : Salva los datos interpolados en archivos netcdf con estructura anual o mensual.
 
+     iTimeRange : 
+       (primero,ultimo) Rango de indices temporales del archivo fuente a procesar, 'ultimo' no incluido.
+       None procesa todos los registros.
+     sPeriodo :
+       Solo con saveMethod 2. Clave del periodo (ver clavePeriodo) que se va a salvar, los registros
+       fuera de ese periodo solo se utilizan como indices -1 y +1 del periodo. None salva todos los periodos.
+     nTimeChunk :
+       Numero de registros temporales que se leen, interpolan y salvan a la vez. Limita la memoria
+       utilizada, None procesa todos los registros en un solo bloque. (ver obc_memory.py)
+     nPrefetch :
+       Filas de chunks del archivo fuente que se mantienen en la cache de netCDF, 0 no modifica la cache.
+     nVecinos, sMetodoHorizontal :
+       Vecinos del archivo fuente para cada punto de la frontera, y metodo 'nearest' o 'idw' (ver localizadorFrontera.py)
+     dMascara, dLoc :
+       Mascara (ver cargarMascara) y localizadores de las fronteras (ver localizarFronteras) ya calculados,
+       None los calcula. Los utiliza el servicio obc_service.py para no recalcularlos en cada trabajo.
+
     """
     # Configuration paths, indices fronteras,
     # sMaskFile   - Archivo de mascara de batimetria, con nav_lon,nav_lat,nav_lev de la malla
@@ -147,23 +276,18 @@ def crearFronterasEsteSur(dataSourceFile,sMaskFile,iEastIndex=-1,iSouthIndex=1,
     ##
     # Cargar datos de la mascara GOLFO24 malla T 
     ##
-    ncMask = nc.Dataset(sMaskFile,'r')
-    ncMaskLat = ncMask.variables['nav_lat'][:]
-    ncMaskLon = ncMask.variables['nav_lon'][:]
-    ncMaskDepth = ncMask.variables['nav_lev'][:]
-
+    if dMascara == None:
+        dMascara = cargarMascara(sMaskFile,iEastIndex,iSouthIndex)
+    ncMaskLat = dMascara['nav_lat']
+    ncMaskLon = dMascara['nav_lon']
+    ncMaskDepth = dMascara['nav_lev']
 
     # Mascara de rebanadas en frontera este y sur.
-    ncMaskT = ncMask.variables['tmask'][0][0][:][:]
-    ncMaskEast = ncMask.variables['tmask'][0,:,:,iEastIndex] 
-    ncMaskSouth = ncMask.variables['tmask'][0,:,iSouthIndex,:] 
+    ncMaskEast = dMascara['tmaskEast']
+    ncMaskSouth = dMascara['tmaskSouth']
 
-    ncMaskEastLon = ncMaskLon[:,iEastIndex]
     ncMaskEastLat = ncMaskLat[:,iEastIndex]
-
     ncMaskSouthLon = ncMaskLon[iSouthIndex,:]
-    ncMaskSouthLat = ncMaskLat[iSouthIndex,:]
-    ncMask.close() 
 
     ##
     # Cargar datos del archivo de mercator
@@ -176,117 +300,91 @@ def crearFronterasEsteSur(dataSourceFile,sMaskFile,iEastIndex=-1,iSouthIndex=1,
     ncMerTime_units = ncMer.variables['time_counter'].units 
     ncMerTime_calendar = ncMer.variables['time_counter'].calendar
 
-    # Obtener el indice mas cercano al requerido para la frontera este y sur
-    # haciendo la diferencia mas pequena de las posiciones en la mascara con los datos de mercator
-    iMerEastIndex = np.argmin(np.abs(ncMerLon - np.max(ncMaskEastLon))) 
-    iMerSouthIndex = np.argmin(np.abs(ncMerLat - np.min(ncMaskSouthLat)))
-
-    iMaxMaskLatInData = np.argmin(np.abs(ncMerLat - np.max(ncMaskLat)))
-    iMinMaskLatInData = np.argmin(np.abs(ncMerLat - np.min(ncMaskLat)))
-    #print 'MaskLatInData Max, Min ' + str(iMaxMaskLatInData) + ' , ' + str(iMinMaskLatInData)
+    # Rango de registros temporales a procesar
+    if iTimeRange != None:
+        iTimeFirst, iTimeLast = iTimeRange
+    else:
+        iTimeFirst, iTimeLast = 0, ncMerTime.size
+    ncMerTime = ncMerTime[iTimeFirst:iTimeLast]
+
+    # Localizar los puntos 2D de la frontera este y sur en la malla del archivo fuente,
+    # los vecinos y pesos se reutilizan para todas las variables y registros.
+    if dLoc == None:
+        dLoc = localizarFronteras(ncMerLat,ncMerLon,ncMerDepth,ncMaskLat,ncMaskLon,ncMaskDepth,iEastIndex,iSouthIndex,nVecinos,sMetodoHorizontal)
+    dRegiones = {'east' : dLoc['east'].regiones , 'south' : dLoc['south'].regiones}
+
+    # Tamano de los bloques temporales que se interpolan y salvan a la vez
+    if nTimeChunk == None:
+        nTimeChunk = ncMerTime.size
+    nTimeChunk = max(1, min(nTimeChunk, ncMerTime.size))
+    if nPrefetch > 0:
+        for sVar in ['temperature','salinity','u','v']:
+            configurarCacheFuente(ncMer.variables[sVar], dRegiones, nPrefetch)
+
+    def interpolarBloque(iFirst, iLast):
+        """
+         Interpola los registros [iFirst,iLast) del rango procesado, leyendo del archivo fuente
+         un bloque temporal por variable y frontera. Regresa los arreglos interpolados
+         de cada frontera en <python dict> por variable, con dimensiones (t,z,y|x)
+        """
+        dEast = {}
+        dSouth = {}
+        for sVar in ['temperature','salinity','u','v']:
+            EastBlock = dLoc['east'].leer(ncMer.variables[sVar], slice(iTimeFirst+iFirst,iTimeFirst+iLast))
+            SouthBlock = dLoc['south'].leer(ncMer.variables[sVar], slice(iTimeFirst+iFirst,iTimeFirst+iLast))
+            if sVar == 'temperature':
+                EastBlock[EastBlock > 0] = EastBlock[EastBlock > 0] - 272.15
+                SouthBlock[SouthBlock > 0] = SouthBlock[SouthBlock > 0] - 272.15
+            log.info('Proceso de interpolacion ' + sVar + ', indices: ' + str(iFirst) + ' - ' + str(iLast-1) + '  Tiempo: ' + str(ncMerTime[iFirst]) + ' - ' + str(ncMerTime[iLast-1]))
+            # Frontera Este y Sur
+            dEast[sVar] = dLoc['east'].interpolar(EastBlock)
+            dSouth[sVar] = dLoc['south'].interpolar(SouthBlock)
+            for idx in range(iLast-iFirst):
+                dEast[sVar][idx,:,:] = applyMask(dEast[sVar][idx,:,:], ncMaskEast)
+                dSouth[sVar][idx,:,:] = applyMask(dSouth[sVar][idx,:,:], ncMaskSouth)
+        return dEast, dSouth
+
+    def salvarRegistros(dNombres, iBuf, iSlot):
+        """
+         Salva los registros 'iBuf' del bloque interpolado en los indices 'iSlot' de los archivos abiertos.
+         dNombres: Nombres de las variables de salida para temperature, salinity, u y v.
+        """
+        ncOutFiles['eastTS'].saveDataS(dNombres['temperature'] , dEastGrids['temperature'][iBuf] , iSlot)
+        ncOutFiles['eastTS'].saveDataS(dNombres['salinity'] , dEastGrids['salinity'][iBuf] , iSlot)
+        ncOutFiles['eastU'].saveDataS(dNombres['u'] , dEastGrids['u'][iBuf] , iSlot)
+        ncOutFiles['eastV'].saveDataS(dNombres['v'] , dEastGrids['v'][iBuf] , iSlot)
 
-    iMaxMaskLonInData = np.argmin(np.abs(ncMerLon - np.max(ncMaskLon)))
-    iMinMaskLonInData = np.argmin(np.abs(ncMerLon - np.min(ncMaskLon)))   
-    #print 'MaskLonInData Max, Min ' + str(iMaxMaskLonInData) + ' , ' + str(iMinMaskLonInData)
+        ncOutFiles['southTS'].saveDataS(dNombres['temperature'] , dSouthGrids['temperature'][iBuf] , iSlot)
+        ncOutFiles['southTS'].saveDataS(dNombres['salinity'] , dSouthGrids['salinity'][iBuf] , iSlot)
+        ncOutFiles['southU'].saveDataS(dNombres['u'] , dSouthGrids['u'][iBuf] , iSlot)
+        ncOutFiles['southV'].saveDataS(dNombres['v'] , dSouthGrids['v'][iBuf] , iSlot)
 
-    ##
-    # Arreglos donde descargar datos interpolados, reservando memoria.
-    ##
-    nEastTempGrid = np.zeros((ncMerTime.size,ncMaskDepth.size,ncMaskEastLat.size), float)
-    nEastSalGrid  = np.zeros((ncMerTime.size,ncMaskDepth.size,ncMaskEastLat.size), float) 
-    nEastUcompGrid = np.zeros((ncMerTime.size,ncMaskDepth.size,ncMaskEastLat.size), float) 
-    nEastVcompGrid = np.zeros((ncMerTime.size,ncMaskDepth.size,ncMaskEastLat.size), float) 
-
-    nSouthTempGrid = np.zeros((ncMerTime.size,ncMaskDepth.size,ncMaskSouthLon.size), float)
-    nSouthSalGrid  = np.zeros((ncMerTime.size,ncMaskDepth.size,ncMaskSouthLon.size), float) 
-    nSouthUcompGrid = np.zeros((ncMerTime.size,ncMaskDepth.size,ncMaskSouthLon.size), float) 
-    nSouthVcompGrid = np.zeros((ncMerTime.size,ncMaskDepth.size,ncMaskSouthLon.size), float) 
-    ##
-    # Ciclar en rango de la variable temporal del archivo dataSourceFile
-    ##
-    for idx,merTime in enumerate(ncMerTime):
-        log.info('Proceso de interpolacion, indice: ' + str(idx) + '  Tiempo: ' + str(merTime))
-        #________________
-        ## TEMPERATURA
-        # Frontera Este
-        EastSlice = ncMer.variables['temperature'][idx,:,iMinMaskLatInData:iMaxMaskLatInData,iMerEastIndex]
-        EastSlice[EastSlice > 0] = EastSlice[EastSlice > 0] - 272.15
-        
-        # interpolar 
-        nEastTempGrid[idx,:,:] = applyMask(interpIrregularGridToRegular(ncMerDepth,ncMerLat[iMinMaskLatInData:iMaxMaskLatInData],EastSlice,ncMaskDepth,ncMaskEastLat,'nearest'), ncMaskEast)
-        # Frontera Sur
-        SouthSlice = ncMer.variables['temperature'][idx,:,iMerSouthIndex,iMinMaskLonInData:iMaxMaskLonInData]
-        SouthSlice[SouthSlice > 0] = SouthSlice[SouthSlice > 0] - 272.15
-        # interpolar 
-        nSouthTempGrid[idx,:,:] = applyMask(interpIrregularGridToRegular(ncMerDepth,ncMerLon[iMinMaskLonInData:iMaxMaskLonInData],SouthSlice,ncMaskDepth,ncMaskSouthLon,'nearest'), ncMaskSouth)
-
-        #________________
-        ## SALINIDAD
-        # Frontera Este
-        EastSlice = ncMer.variables['salinity'][idx,:,iMinMaskLatInData:iMaxMaskLatInData,iMerEastIndex]
-        # interpolar 
-        nEastSalGrid[idx,:,:] = applyMask(interpIrregularGridToRegular(ncMerDepth,ncMerLat[iMinMaskLatInData:iMaxMaskLatInData],EastSlice,ncMaskDepth,ncMaskEastLat,'nearest'), ncMaskEast )
-        # Frontera Sur
-        SouthSlice = ncMer.variables['salinity'][idx,:,iMerSouthIndex,iMinMaskLonInData:iMaxMaskLonInData]
-        # interpolar 
-        nSouthSalGrid[idx,:,:] = applyMask(interpIrregularGridToRegular(ncMerDepth,ncMerLon[iMinMaskLonInData:iMaxMaskLonInData],SouthSlice,ncMaskDepth,ncMaskSouthLon,'nearest'), ncMaskSouth )   
-
-        #________________
-        ## Componente de Velocidad U
-        # Frontera Este
-        EastSlice = ncMer.variables['u'][idx,:,iMinMaskLatInData:iMaxMaskLatInData,iMerEastIndex]
-        # interpolar 
-        nEastUcompGrid[idx,:,:] = applyMask(interpIrregularGridToRegular(ncMerDepth,ncMerLat[iMinMaskLatInData:iMaxMaskLatInData],EastSlice,ncMaskDepth,ncMaskEastLat,'nearest'), ncMaskEast )
-        # Frontera Sur
-        SouthSlice = ncMer.variables['u'][idx,:,iMerSouthIndex,iMinMaskLonInData:iMaxMaskLonInData]
-        # interpolar 
-        nSouthUcompGrid[idx,:,:] = applyMask(interpIrregularGridToRegular(ncMerDepth,ncMerLon[iMinMaskLonInData:iMaxMaskLonInData],SouthSlice,ncMaskDepth,ncMaskSouthLon,'nearest'), ncMaskSouth ) 
-
-        #________________
-        ## Componente de Velocidad V
-        # Frontera Este
-        EastSlice = ncMer.variables['v'][idx,:,iMinMaskLatInData:iMaxMaskLatInData,iMerEastIndex]
-        # interpolar 
-        nEastVcompGrid[idx,:,:] = applyMask(interpIrregularGridToRegular(ncMerDepth,ncMerLat[iMinMaskLatInData:iMaxMaskLatInData],EastSlice,ncMaskDepth,ncMaskEastLat,'nearest'), ncMaskEast )
-        # Frontera Sur
-        SouthSlice = ncMer.variables['v'][idx,:,iMerSouthIndex,iMinMaskLonInData:iMaxMaskLonInData]
-        # interpolar 
-        nSouthVcompGrid[idx,:,:] = applyMask(interpIrregularGridToRegular(ncMerDepth,ncMerLon[iMinMaskLonInData:iMaxMaskLonInData],SouthSlice,ncMaskDepth,ncMaskSouthLon,'nearest'), ncMaskSouth )                 
-
-    ncMer.close()
-    
     # Salvar estos datos en un archivo netcdf
     # Method =  1 - Salvar sin estructura mensual-anual, solo los datos de entrada
     # Method =  2 - Salvar datos con estructura mensual o anual
-
+    ncOutFiles = {}
     if saveMethod==1:
+        dNombres = {'temperature' : 'temp' , 'salinity' : 'salinity' , 'u' : 'u' , 'v' : 'v'}
         # EAST Files
         dDims = {'time_counter':None , 'depth' : ncMaskDepth.size , 'y' : ncMaskEastLat.size} 
         dVars = {'dimensions' : ['time_counter','depth','y'] , 'attributes' : {'_FillValue':0}, 'dataType' : 'f4' } 
         dVarsTS = {} 
         dVarsTS['temp'] = dVars 
         dVarsTS['salinity'] = dVars 
-        ncOutFile = netcdfFile.netcdfFile()
-        ncOutFile.createFile('EastTS_OBC.nc') 
-        ncOutFile.createDims(dDims)
-        ncOutFile.createVars(dVarsTS)
-        ncOutFile.saveData({'temp' : nEastTempGrid , 'salinity' : nEastSalGrid})
-        ncOutFile.closeFile()
-
-
-        ncOutFile = netcdfFile.netcdfFile()
-        ncOutFile.createFile('EastU_OBC.nc') 
-        ncOutFile.createDims(dDims)
-        ncOutFile.createVars( {'u' : dVars} )
-        ncOutFile.saveData( {'u' : nEastUcompGrid } )
-        ncOutFile.closeFile()   
-
-        ncOutFile = netcdfFile.netcdfFile()
-        ncOutFile.createFile('EastV_OBC.nc') 
-        ncOutFile.createDims(dDims)
-        ncOutFile.createVars( {'v' : dVars} )
-        ncOutFile.saveData( {'v' : nEastVcompGrid } )
-        ncOutFile.closeFile()   
+        ncOutFiles['eastTS'] = netcdfFile.netcdfFile()
+        ncOutFiles['eastTS'].createFile('EastTS_OBC.nc') 
+        ncOutFiles['eastTS'].createDims(dDims)
+        ncOutFiles['eastTS'].createVars(dVarsTS)
+
+        ncOutFiles['eastU'] = netcdfFile.netcdfFile()
+        ncOutFiles['eastU'].createFile('EastU_OBC.nc') 
+        ncOutFiles['eastU'].createDims(dDims)
+        ncOutFiles['eastU'].createVars( {'u' : dVars} )
+
+        ncOutFiles['eastV'] = netcdfFile.netcdfFile()
+        ncOutFiles['eastV'].createFile('EastV_OBC.nc') 
+        ncOutFiles['eastV'].createDims(dDims)
+        ncOutFiles['eastV'].createVars( {'v' : dVars} )
 
         # SOUTH Files
         dDims = {'time_counter':None , 'depth' : ncMaskDepth.size , 'x': ncMaskSouthLon.size} 
@@ -294,225 +392,206 @@ def crearFronterasEsteSur(dataSourceFile,sMaskFile,iEastIndex=-1,iSouthIndex=1,
         dVarsTS = {} 
         dVarsTS['temp'] = dVars 
         dVarsTS['salinity'] = dVars 
-        ncOutFile = netcdfFile.netcdfFile()
-        ncOutFile.createFile('SouthTS_OBC.nc') 
-        ncOutFile.createDims(dDims)
-        ncOutFile.createVars(dVarsTS)
-        ncOutFile.saveData({'temp' : nSouthTempGrid , 'salinity' : nSouthSalGrid})
-        ncOutFile.closeFile()
-
-
-        ncOutFile = netcdfFile.netcdfFile()
-        ncOutFile.createFile('SouthtU_OBC.nc') 
-        ncOutFile.createDims(dDims)
-        ncOutFile.createVars( {'u' : dVars} )
-        ncOutFile.saveData( {'u' : nSouthUcompGrid } )
-        ncOutFile.closeFile()   
-
-        ncOutFile = netcdfFile.netcdfFile()
-        ncOutFile.createFile('SouthV_OBC.nc') 
-        ncOutFile.createDims(dDims)
-        ncOutFile.createVars( {'v' : dVars} )
-        ncOutFile.saveData( {'v' : nSouthVcompGrid } )
-        ncOutFile.closeFile()   
+        ncOutFiles['southTS'] = netcdfFile.netcdfFile()
+        ncOutFiles['southTS'].createFile('SouthTS_OBC.nc') 
+        ncOutFiles['southTS'].createDims(dDims)
+        ncOutFiles['southTS'].createVars(dVarsTS)
+
+        ncOutFiles['southU'] = netcdfFile.netcdfFile()
+        ncOutFiles['southU'].createFile('SouthtU_OBC.nc') 
+        ncOutFiles['southU'].createDims(dDims)
+        ncOutFiles['southU'].createVars( {'u' : dVars} )
+
+        ncOutFiles['southV'] = netcdfFile.netcdfFile()
+        ncOutFiles['southV'].createFile('SouthV_OBC.nc') 
+        ncOutFiles['southV'].createDims(dDims)
+        ncOutFiles['southV'].createVars( {'v' : dVars} )
 
     elif saveMethod == 2:
         """
          Metodo para salvar los datos interpolados en archivos anuales o mensuales
         """        
+        dNombres = {'temperature' : 'votemper' , 'salinity' : 'vosaline' , 'u' : 'vozocrtx' , 'v' : 'vomecrty'}
         # sFilesSize = 'yearly' # Or 'monthly'
-
-        # Correr el ciclo con los valores de la dimension temporal: ncMerTime 
-        # dependiendo de su mes y ano generamos un nuevo archivo mensual o anual segun sFilesSize
-        # para almacenar la informacion
-        log.info('Interpolacion lista, salvando datos en formato para NEMO. Archivos: ' + sFilesSize)
+        log.info('Salvando datos en formato para NEMO. Archivos: ' + sFilesSize)
         # Variable del archivo donde se estan almacenando los datos durante el ciclo.
         currentTimeFile = None 
-        for idx_tval, tval in enumerate(ncMerTime):
-            # Convertir el tval a <python datetime>
-            tval_datetime = nc.num2date(tval,ncMerTime_units,ncMerTime_calendar) 
-            log.info('Salvando indice: ' + str(idx_tval) + ' Tiempo: ' + str(tval_datetime))
-
-            compareVarDummyForFileSize = tval_datetime.year if (sFilesSize == 'yearly') else tval_datetime.month 
 
-            if currentTimeFile == None or currentTimeFile != compareVarDummyForFileSize:
-                # Crear el archivo(s) para el periodo mensual o anual segun corresponda
-                if sFilesSize == 'yearly':
-                    currentTimeFile = tval_datetime.year
-                else:
-                    currentTimeFile = tval_datetime.month                
-
-                # Empezar por la creacion de la variable de dimension temporal.
-                # ds es el primer dia del (mes o ano) menos un dia 
-                if sFilesSize == 'yearly':
-                    ds = dt.datetime(tval_datetime.year,1,1,tval_datetime.hour) - dt.timedelta(days=1)
-                else:
-                    ds = dt.datetime(tval_datetime.year,tval_datetime.month,1,tval_datetime.hour) - dt.timedelta(days=1)
-                # nm es el numero de mes, del archivo actual
-                # ny es el numero de ano, del archivo actual 
-                nm = tval_datetime.month
-                ny = tval_datetime.year                
+    ##
+    # Ciclar por bloques en rango de la variable temporal del archivo dataSourceFile
+    ##
+    for iChunk in range(0,ncMerTime.size,nTimeChunk):
+        iChunkEnd = min(iChunk+nTimeChunk, ncMerTime.size)
+        # Con saveMethod 2 se interpola ademas un registro antes y uno despues del bloque,
+        # para los indices -1 y +1 de los periodos. iBufFirst es el indice del primer registro interpolado.
+        if saveMethod == 2:
+            iBufFirst, iBufLast = max(iChunk-1, 0), min(iChunkEnd+1, ncMerTime.size)
+        else:
+            iBufFirst, iBufLast = iChunk, iChunkEnd
+        dEastGrids, dSouthGrids = interpolarBloque(iBufFirst, iBufLast)
+
+        if saveMethod==1:
+            salvarRegistros(dNombres, slice(iChunk-iBufFirst, iChunkEnd-iBufFirst), slice(iChunk, iChunkEnd))
+
+        elif saveMethod == 2:
+            # Correr el ciclo con los valores de la dimension temporal: ncMerTime 
+            # dependiendo de su mes y ano generamos un nuevo archivo mensual o anual segun sFilesSize
+            # para almacenar la informacion
+            for idx_tval in range(iChunk, iChunkEnd):
+                # Convertir el tval a <python datetime>
+                tval_datetime = nc.num2date(ncMerTime[idx_tval],ncMerTime_units,ncMerTime_calendar) 
+                # Registros de un periodo vecino, solo se usan como indices -1 y +1 del periodo que se salva.
+                if sPeriodo != None and clavePeriodo(tval_datetime,sFilesSize) != sPeriodo:
+                    continue
+                log.info('Salvando indice: ' + str(idx_tval) + ' Tiempo: ' + str(tval_datetime))
+
+                compareVarDummyForFileSize = tval_datetime.year if (sFilesSize == 'yearly') else tval_datetime.month 
+
+                if currentTimeFile == None or currentTimeFile != compareVarDummyForFileSize:
+                    # Crear el archivo(s) para el periodo mensual o anual segun corresponda
+                    if sFilesSize == 'yearly':
+                        currentTimeFile = tval_datetime.year
+                    else:
+                        currentTimeFile = tval_datetime.month                
+
+                    # Empezar por la creacion de la variable de dimension temporal.
+                    # ds es el primer dia del (mes o ano) menos un dia 
+                    if sFilesSize == 'yearly':
+                        ds = dt.datetime(tval_datetime.year,1,1,tval_datetime.hour) - dt.timedelta(days=1)
+                    else:
+                        ds = dt.datetime(tval_datetime.year,tval_datetime.month,1,tval_datetime.hour) - dt.timedelta(days=1)
+                    # nm es el numero de mes, del archivo actual
+                    # ny es el numero de ano, del archivo actual 
+                    nm = tval_datetime.month
+                    ny = tval_datetime.year                
            
-                # Tamano de la dimension temporal de este periodo, segun el calendario que se utilize.
+                    # Tamano de la dimension temporal de este periodo, segun el calendario que se utilize.
+                    if sFilesSize == 'yearly':
+                        sFileTDimSize = dateToNemoCalendar(tval_datetime,sCalendarType,'yearLen') + 2
+                    else:
+                        sFileTDimSize = dateToNemoCalendar(tval_datetime,sCalendarType,'monthLen') + 2
+
+                    # timeVD es la variable de la dimension temporal, contiene el tamano del periodo actual segun el calendario
+                    # que se utilize (gregoriam, noleap, 366day, 360day) mas 1 dia atras y 1 dia adelante. 
+                    timeVD = [] 
+                    for i in range(0,sFileTDimSize):
+                        # timeVD.append(nc.date2num(ds + dt.timedelta(days=1*i) , ncMerTime_units, ncMerTime_calendar ))
+                        timeVD.append(dateToNemoCalendar(ds + dt.timedelta(days=1*i) , sCalendarType)) 
+
+                    ncOutFiles = {}
+                    # Creamos los archivos netcdf para descargar datos.
+                    # Dimensiones, variables y atributos para archivos ESTE y SUR (TS,U,V)
+                    dDimEastT = {'time_counter':None , 'deptht' : ncMaskDepth.size , 'y' : ncMaskEastLat.size} 
+                    dDimVarsT = {'time_counter': {'dimensions':['time_counter']  , 'dataType' : 'f4' } , 'deptht' : {'dimensions':['deptht'],'dataType':'f4'} }
+                    dVarPropertiesEastT = {'dimensions' : ['time_counter','deptht','y'] , 'attributes' : {'_FillValue':0} , 'dataType' : 'f4' } 
+                    dDimSouthT = {'time_counter':None , 'deptht' : ncMaskDepth.size , 'x' : ncMaskSouthLon.size} 
+                    dVarPropertiesSouthT = {'dimensions' : ['time_counter','deptht','x'] , 'attributes' : {'_FillValue':0}, 'dataType' : 'f4' }
+
+                    dDimEastU = {'time_counter':None , 'depthu' : ncMaskDepth.size , 'y' : ncMaskEastLat.size} 
+                    dDimVarsU = {'time_counter': {'dimensions':['time_counter']  , 'dataType' : 'f4' } , 'depthu' : {'dimensions':['depthu'],'dataType':'f4'} } 
+                    dVarPropertiesEastU = {'dimensions' : ['time_counter','depthu','y'] , 'attributes' : {'_FillValue':0}, 'dataType' : 'f4' } 
+                    dDimSouthU = {'time_counter':None , 'depthu' : ncMaskDepth.size , 'x' : ncMaskSouthLon.size} 
+                    dVarPropertiesSouthU = {'dimensions' : ['time_counter','depthu','x'] , 'attributes' : {'_FillValue':0}, 'dataType' : 'f4' }
+
+                    dDimEastV = {'time_counter':None , 'depthv' : ncMaskDepth.size , 'y' : ncMaskEastLat.size} 
+                    dDimVarsV = {'time_counter': {'dimensions':['time_counter'] , 'dataType' : 'f4' } , 'depthv' : {'dimensions':['depthv'],'dataType':'f4'} } 
+                    dVarPropertiesEastV = {'dimensions' : ['time_counter','depthv','y'] , 'attributes' : {'_FillValue':0}, 'dataType' : 'f4' } 
+                    dDimSouthV = {'time_counter':None , 'depthv' : ncMaskDepth.size , 'x' : ncMaskSouthLon.size} 
+                    dVarPropertiesSouthV = {'dimensions' : ['time_counter','depthv','x'] , 'attributes' : {'_FillValue':0}, 'dataType' : 'f4' }
+
+                    #############################
+                    # Archivos de Frontera ESTE #
+                    #############################
+                
+                    sFileOutSuffix = clavePeriodo(tval_datetime,sFilesSize) + '.nc'
+
+                    obcFileName = fileOutPrefix + '_east_TS_' + sFileOutSuffix
+                    ncOutFiles['eastTS'] = netcdfFile.netcdfFile() 
+                    ncOutFiles['eastTS'].createFile(obcFileName)
+                    ncOutFiles['eastTS'].createDims(dDimEastT) 
+                    ncOutFiles['eastTS'].createVars(dDimVarsT) 
+                    ncOutFiles['eastTS'].createVars({'votemper' : dVarPropertiesEastT , 'vosaline' : dVarPropertiesEastT }) 
+                    ncOutFiles['eastTS'].saveData({'time_counter' : timeVD , 'deptht' : ncMaskDepth[:]})
+
+                    obcFileName = fileOutPrefix + '_east_U_' + sFileOutSuffix
+                    ncOutFiles['eastU'] = netcdfFile.netcdfFile()
+                    ncOutFiles['eastU'].createFile(obcFileName)
+                    ncOutFiles['eastU'].createDims(dDimEastU) 
+                    ncOutFiles['eastU'].createVars(dDimVarsU) 
+                    ncOutFiles['eastU'].createVars({'vozocrtx' : dVarPropertiesEastU}) 
+                    ncOutFiles['eastU'].saveData({'time_counter' : timeVD , 'depthu' : ncMaskDepth[:]})
+
+                    obcFileName = fileOutPrefix + '_east_V_' + sFileOutSuffix
+                    ncOutFiles['eastV'] = netcdfFile.netcdfFile()
+                    ncOutFiles['eastV'].createFile(obcFileName)
+                    ncOutFiles['eastV'].createDims(dDimEastV) 
+                    ncOutFiles['eastV'].createVars(dDimVarsV) 
+                    ncOutFiles['eastV'].createVars({'vomecrty' : dVarPropertiesEastV}) 
+                    ncOutFiles['eastV'].saveData({'time_counter' : timeVD , 'depthv' : ncMaskDepth[:]})
+
+                    ############################
+                    # Archivos de Frontera SUR #   
+                    ############################                
+                    obcFileName = fileOutPrefix + '_south_TS_' + sFileOutSuffix
+                    ncOutFiles['southTS'] = netcdfFile.netcdfFile()
+                    ncOutFiles['southTS'].createFile(obcFileName)
+                    ncOutFiles['southTS'].createDims(dDimSouthT) 
+                    ncOutFiles['southTS'].createVars(dDimVarsT) 
+                    ncOutFiles['southTS'].createVars({'votemper' : dVarPropertiesSouthT , 'vosaline' : dVarPropertiesSouthT }) 
+                    ncOutFiles['southTS'].saveData({'time_counter' : timeVD , 'deptht' : ncMaskDepth[:]})
+
+                    obcFileName = fileOutPrefix + '_south_U_' + sFileOutSuffix
+                    ncOutFiles['southU'] = netcdfFile.netcdfFile()
+                    ncOutFiles['southU'].createFile(obcFileName)
+                    ncOutFiles['southU'].createDims(dDimSouthU) 
+                    ncOutFiles['southU'].createVars(dDimVarsU) 
+                    ncOutFiles['southU'].createVars({'vozocrtx' : dVarPropertiesSouthU}) 
+                    ncOutFiles['southU'].saveData({'time_counter' : timeVD , 'depthu' : ncMaskDepth[:]})
+                
+                    obcFileName = fileOutPrefix + '_south_V_' + sFileOutSuffix
+                    ncOutFiles['southV'] = netcdfFile.netcdfFile()
+                    ncOutFiles['southV'].createFile(obcFileName)
+                    ncOutFiles['southV'].createDims(dDimSouthV) 
+                    ncOutFiles['southV'].createVars(dDimVarsV) 
+                    ncOutFiles['southV'].createVars({'vomecrty' : dVarPropertiesSouthV}) 
+                    ncOutFiles['southV'].saveData({'time_counter' : timeVD , 'depthv' : ncMaskDepth[:]})
+
+                #############################################
+                # FIN BLOQUE Creacion de archivos frontera. #
+                ############################################# 
+
+                # Salvar cada dato en su archivo correspondiente.
+
+                # Primero localizar el indice donde pondremos el dato: 
+                idx = (np.abs(timeVD - dateToNemoCalendar(tval_datetime,sCalendarType,))).argmin()
+                log.info('Salvando en el archivo, con indice: ' + str(idx))
+                salvarRegistros(dNombres, idx_tval-iBufFirst, idx)
+
+                # Llenar el ultimo valor, en los archivos, para lograr "permanencia."
+                if (idx_tval == (ncMerTime.size-1)):
+                    for ext in range(idx,len(timeVD)):
+                        salvarRegistros(dNombres, idx_tval-iBufFirst, ext)
+
+                # Lidiar con los indices -1 y +1 del periodo temporal. 
                 if sFilesSize == 'yearly':
-                    sFileTDimSize = dateToNemoCalendar(tval_datetime,sCalendarType,'yearLen') + 2
+                    conditionLessOne = (tval_datetime.month == 1 and tval_datetime.day == 1 and idx_tval > 0)
                 else:
-                    sFileTDimSize = dateToNemoCalendar(tval_datetime,sCalendarType,'monthLen') + 2
-
-                # timeVD es la variable de la dimension temporal, contiene el tamano del periodo actual segun el calendario
-                # que se utilize (gregoriam, noleap, 366day, 360day) mas 1 dia atras y 1 dia adelante. 
-                timeVD = [] 
-                for i in range(0,sFileTDimSize):
-                    # timeVD.append(nc.date2num(ds + dt.timedelta(days=1*i) , ncMerTime_units, ncMerTime_calendar ))
-                    timeVD.append(dateToNemoCalendar(ds + dt.timedelta(days=1*i) , sCalendarType)) 
-
-                ncOutFiles = {}
-                # Creamos los archivos netcdf para descargar datos.
-                # Dimensiones, variables y atributos para archivos ESTE y SUR (TS,U,V)
-                dDimEastT = {'time_counter':None , 'deptht' : ncMaskDepth.size , 'y' : ncMaskEastLat.size} 
-                dDimVarsT = {'time_counter': {'dimensions':['time_counter']  , 'dataType' : 'f4' } , 'deptht' : {'dimensions':['deptht'],'dataType':'f4'} }
-                dVarPropertiesEastT = {'dimensions' : ['time_counter','deptht','y'] , 'attributes' : {'_FillValue':0} , 'dataType' : 'f4' } 
-                dDimSouthT = {'time_counter':None , 'deptht' : ncMaskDepth.size , 'x' : ncMaskSouthLon.size} 
-                dVarPropertiesSouthT = {'dimensions' : ['time_counter','deptht','x'] , 'attributes' : {'_FillValue':0}, 'dataType' : 'f4' }
-
-                dDimEastU = {'time_counter':None , 'depthu' : ncMaskDepth.size , 'y' : ncMaskEastLat.size} 
-                dDimVarsU = {'time_counter': {'dimensions':['time_counter']  , 'dataType' : 'f4' } , 'depthu' : {'dimensions':['depthu'],'dataType':'f4'} } 
-                dVarPropertiesEastU = {'dimensions' : ['time_counter','depthu','y'] , 'attributes' : {'_FillValue':0}, 'dataType' : 'f4' } 
-                dDimSouthU = {'time_counter':None , 'depthu' : ncMaskDepth.size , 'x' : ncMaskSouthLon.size} 
-                dVarPropertiesSouthU = {'dimensions' : ['time_counter','depthu','x'] , 'attributes' : {'_FillValue':0}, 'dataType' : 'f4' }
-
-                dDimEastV = {'time_counter':None , 'depthv' : ncMaskDepth.size , 'y' : ncMaskEastLat.size} 
-                dDimVarsV = {'time_counter': {'dimensions':['time_counter'] , 'dataType' : 'f4' } , 'depthv' : {'dimensions':['depthv'],'dataType':'f4'} } 
-                dVarPropertiesEastV = {'dimensions' : ['time_counter','depthv','y'] , 'attributes' : {'_FillValue':0}, 'dataType' : 'f4' } 
-                dDimSouthV = {'time_counter':None , 'depthv' : ncMaskDepth.size , 'x' : ncMaskSouthLon.size} 
-                dVarPropertiesSouthV = {'dimensions' : ['time_counter','depthv','x'] , 'attributes' : {'_FillValue':0}, 'dataType' : 'f4' }
-
-                #############################
-                # Archivos de Frontera ESTE #
-                #############################
-                
+                    conditionLessOne = (tval_datetime.day == 1 and idx_tval > 0)
+
+                if conditionLessOne:
+                    salvarRegistros(dNombres, idx_tval-1-iBufFirst, 0)
+
                 if sFilesSize == 'yearly':
-                    sFileOutSuffix = 'y' + str(ny) + 'm00.nc'
+                    conditionPlusOne = (idx_tval < (ncMerTime.size-1) and nc.num2date(ncMerTime[idx_tval+1],ncMerTime_units,ncMerTime_calendar).year != currentTimeFile)
                 else:
-                    sFileOutSuffix = 'y' + str(ny) + 'm' + ("%02d"%nm) + '.nc'
-
-                obcFileName = fileOutPrefix + '_east_TS_' + sFileOutSuffix
-                ncOutFiles['eastTS'] = netcdfFile.netcdfFile() 
-                ncOutFiles['eastTS'].createFile(obcFileName)
-                ncOutFiles['eastTS'].createDims(dDimEastT) 
-                ncOutFiles['eastTS'].createVars(dDimVarsT) 
-                ncOutFiles['eastTS'].createVars({'votemper' : dVarPropertiesEastT , 'vosaline' : dVarPropertiesEastT }) 
-                ncOutFiles['eastTS'].saveData({'time_counter' : timeVD , 'deptht' : ncMaskDepth[:]})
-
-                obcFileName = fileOutPrefix + '_east_U_' + sFileOutSuffix
-                ncOutFiles['eastU'] = netcdfFile.netcdfFile()
-                ncOutFiles['eastU'].createFile(obcFileName)
-                ncOutFiles['eastU'].createDims(dDimEastU) 
-                ncOutFiles['eastU'].createVars(dDimVarsU) 
-                ncOutFiles['eastU'].createVars({'vozocrtx' : dVarPropertiesEastU}) 
-                ncOutFiles['eastU'].saveData({'time_counter' : timeVD , 'depthu' : ncMaskDepth[:]})
-
-                obcFileName = fileOutPrefix + '_east_V_' + sFileOutSuffix
-                ncOutFiles['eastV'] = netcdfFile.netcdfFile()
-                ncOutFiles['eastV'].createFile(obcFileName)
-                ncOutFiles['eastV'].createDims(dDimEastV) 
-                ncOutFiles['eastV'].createVars(dDimVarsV) 
-                ncOutFiles['eastV'].createVars({'vomecrty' : dVarPropertiesEastV}) 
-                ncOutFiles['eastV'].saveData({'time_counter' : timeVD , 'depthv' : ncMaskDepth[:]})
-
-                ############################
-                # Archivos de Frontera SUR #   
-                ############################                
-                obcFileName = fileOutPrefix + '_south_TS_' + sFileOutSuffix
-                ncOutFiles['southTS'] = netcdfFile.netcdfFile()
-                ncOutFiles['southTS'].createFile(obcFileName)
-                ncOutFiles['southTS'].createDims(dDimSouthT) 
-                ncOutFiles['southTS'].createVars(dDimVarsT) 
-                ncOutFiles['southTS'].createVars({'votemper' : dVarPropertiesSouthT , 'vosaline' : dVarPropertiesSouthT }) 
-                ncOutFiles['southTS'].saveData({'time_counter' : timeVD , 'deptht' : ncMaskDepth[:]})
-
-                obcFileName = fileOutPrefix + '_south_U_' + sFileOutSuffix
-                ncOutFiles['southU'] = netcdfFile.netcdfFile()
-                ncOutFiles['southU'].createFile(obcFileName)
-                ncOutFiles['southU'].createDims(dDimSouthU) 
-                ncOutFiles['southU'].createVars(dDimVarsU) 
-                ncOutFiles['southU'].createVars({'vozocrtx' : dVarPropertiesSouthU}) 
-                ncOutFiles['southU'].saveData({'time_counter' : timeVD , 'depthu' : ncMaskDepth[:]})
-                
-                obcFileName = fileOutPrefix + '_south_V_' + sFileOutSuffix
-                ncOutFiles['southV'] = netcdfFile.netcdfFile()
-                ncOutFiles['southV'].createFile(obcFileName)
-                ncOutFiles['southV'].createDims(dDimSouthV) 
-                ncOutFiles['southV'].createVars(dDimVarsV) 
-                ncOutFiles['southV'].createVars({'vomecrty' : dVarPropertiesSouthV}) 
-                ncOutFiles['southV'].saveData({'time_counter' : timeVD , 'depthv' : ncMaskDepth[:]})
-
-            #############################################
-            # FIN BLOQUE Creacion de archivos frontera. #
-            ############################################# 
-
-            # Salvar cada dato en su archivo correspondiente.
-            
-            # Primero localizar el indice donde pondremos el dato: 
-            idx = (np.abs(timeVD - dateToNemoCalendar(tval_datetime,sCalendarType,))).argmin()
-            log.info('Salvando en el archivo, con indice: ' + str(idx))
-
-            ncOutFiles['eastTS'].saveDataS('votemper' , nEastTempGrid[idx_tval,:,:] , (idx))
-            ncOutFiles['eastTS'].saveDataS('vosaline' , nEastSalGrid[idx_tval,:,:] , (idx))
-            ncOutFiles['eastU'].saveDataS('vozocrtx' , nEastUcompGrid[idx_tval,:,:] , (idx))
-            ncOutFiles['eastV'].saveDataS('vomecrty' , nEastVcompGrid[idx_tval,:,:] , (idx)) 
-
-            ncOutFiles['southTS'].saveDataS('votemper' , nSouthTempGrid[idx_tval,:,:] , (idx))
-            ncOutFiles['southTS'].saveDataS('vosaline' , nSouthSalGrid[idx_tval,:,:] , (idx))
-            ncOutFiles['southU'].saveDataS('vozocrtx' , nSouthUcompGrid[idx_tval,:,:] , (idx))
-            ncOutFiles['southV'].saveDataS('vomecrty' , nSouthVcompGrid[idx_tval,:,:] , (idx)) 
-
-            # Llenar el ultimo valor, en los archivos, para lograr "permanencia."
-            if (idx_tval == (ncMerTime.size-1)):
-                for ext in range(idx,len(timeVD)):
-                    ncOutFiles['eastTS'].saveDataS('votemper' , nEastTempGrid[idx_tval,:,:] , (ext) )
-                    ncOutFiles['eastTS'].saveDataS('vosaline' , nEastSalGrid[idx_tval,:,:] , (ext) )
-                    ncOutFiles['eastU'].saveDataS('vozocrtx' , nEastUcompGrid[idx_tval,:,:] , (ext) )
-                    ncOutFiles['eastV'].saveDataS('vomecrty' , nEastVcompGrid[idx_tval,:,:] , (ext) ) 
-
-                    ncOutFiles['southTS'].saveDataS('votemper' , nSouthTempGrid[idx_tval,:,:] , (ext) )
-                    ncOutFiles['southTS'].saveDataS('vosaline' , nSouthSalGrid[idx_tval,:,:] , (ext) )
-                    ncOutFiles['southU'].saveDataS('vozocrtx' , nSouthUcompGrid[idx_tval,:,:] , (ext) )
-                    ncOutFiles['southV'].saveDataS('vomecrty' , nSouthVcompGrid[idx_tval,:,:] , (ext) ) 
-
-
-            # Lidiar con los indices -1 y +1 del periodo temporal. 
-            if sFilesSize == 'yearly':
-                conditionLessOne = (tval_datetime.month == 1 and tval_datetime.day == 1 and idx_tval > 0)
-            else:
-                conditionLessOne = (tval_datetime.day == 1 and idx_tval > 0)
-
-            if conditionLessOne:
-                ncOutFiles['eastTS'].saveDataS('votemper' , nEastTempGrid[idx_tval-1,:,:] , (0))
-                ncOutFiles['eastTS'].saveDataS('vosaline' , nEastSalGrid[idx_tval-1,:,:] , (0))
-                ncOutFiles['eastU'].saveDataS('vozocrtx' , nEastUcompGrid[idx_tval-1,:,:] , (0))
-                ncOutFiles['eastV'].saveDataS('vomecrty' , nEastVcompGrid[idx_tval-1,:,:] , (0)) 
-
-                ncOutFiles['southTS'].saveDataS('votemper' , nSouthTempGrid[idx_tval-1,:,:] , (0))
-                ncOutFiles['southTS'].saveDataS('vosaline' , nSouthSalGrid[idx_tval-1,:,:] , (0))
-                ncOutFiles['southU'].saveDataS('vozocrtx' , nSouthUcompGrid[idx_tval-1,:,:] , (0))
-                ncOutFiles['southV'].saveDataS('vomecrty' , nSouthVcompGrid[idx_tval-1,:,:] , (0))  
-
-            if sFilesSize == 'yearly':
-                conditionPlusOne = (idx_tval < (ncMerTime.size-1) and nc.num2date(ncMerTime[idx_tval+1],ncMerTime_units,ncMerTime_calendar).year != currentTimeFile)
-            else:
-                conditionPlusOne = (idx_tval < (ncMerTime.size-1) and nc.num2date(ncMerTime[idx_tval+1],ncMerTime_units,ncMerTime_calendar).month != currentTimeFile)
-            if conditionPlusOne:
-                ncOutFiles['eastTS'].saveDataS('votemper' , nEastTempGrid[idx_tval+1,:,:] , (sFileTDimSize-1))
-                ncOutFiles['eastTS'].saveDataS('vosaline' , nEastSalGrid[idx_tval+1,:,:] , (sFileTDimSize-1))
-                ncOutFiles['eastU'].saveDataS('vozocrtx' , nEastUcompGrid[idx_tval+1,:,:] , (sFileTDimSize-1))
-                ncOutFiles['eastV'].saveDataS('vomecrty' , nEastVcompGrid[idx_tval+1,:,:] , (sFileTDimSize-1)) 
-
-                ncOutFiles['southTS'].saveDataS('votemper' , nSouthTempGrid[idx_tval+1,:,:] , (sFileTDimSize-1))
-                ncOutFiles['southTS'].saveDataS('vosaline' , nSouthSalGrid[idx_tval+1,:,:] , (sFileTDimSize-1))
-                ncOutFiles['southU'].saveDataS('vozocrtx' , nSouthUcompGrid[idx_tval+1,:,:] , (sFileTDimSize-1))
-                ncOutFiles['southV'].saveDataS('vomecrty' , nSouthVcompGrid[idx_tval+1,:,:] , (sFileTDimSize-1))                            
+                    conditionPlusOne = (idx_tval < (ncMerTime.size-1) and nc.num2date(ncMerTime[idx_tval+1],ncMerTime_units,ncMerTime_calendar).month != currentTimeFile)
+                if conditionPlusOne:
+                    salvarRegistros(dNombres, idx_tval+1-iBufFirst, sFileTDimSize-1)
 
+    ncMer.close()
+    if saveMethod==1:
+        for sKey in ncOutFiles.keys():
+            ncOutFiles[sKey].closeFile()
 
 
     log.info('Archivos de frontera creados.')
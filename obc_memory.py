@@ -0,0 +1,183 @@
+"""
+ Planificador de memoria para la creacion de archivos OBC.
+
+ A partir de un limite de memoria (por ejemplo '4G'), de las dimensiones del archivo fuente y
+ de la mascara, y del chunking de las variables del archivo fuente, elige:
+  nTimeChunk : Registros temporales que se interpolan y salvan a la vez en cada proceso.
+  nPrefetch  : Filas de chunks del archivo fuente en la cache de netCDF (ver obc_creator.configurarCacheFuente).
+  nWorkers   : Numero de procesos (shards) que se corren a la vez.
+ Y estima el pico de memoria de la corrida.
+
+ La estimacion por registro temporal considera los 8 arreglos interpolados float64
+ (temperatura, salinidad, u y v en frontera este y sur) con dimensiones ncMaskDepth.size por
+ el largo de la frontera, los bloques leidos del archivo fuente y los temporales del
+ localizador de fronteras (localizadorFrontera.py).
+"""
+
+import re
+import multiprocessing
+import logging as log
+import numpy as np
+import netCDF4 as nc
+# own libs
+import obc_creator
+
+# Memoria base de cada proceso (interprete, numpy, scipy, netCDF4), en bytes.
+BASE_PROCESO = 200 * 1024**2
+VARIABLES_FUENTE = ['temperature','salinity','u','v']
+
+
+def parseMemoria(sMemoria):
+    """
+     Convierte un tamano de memoria '4G', '512M', '1.5g', '1024' (bytes) a bytes.
+    """
+    m = re.match(r'^\s*([0-9]*\.?[0-9]+)\s*([kKmMgGtT]?)[iI]?[bB]?\s*$', str(sMemoria))
+    if m == None:
+        raise ValueError('parseMemoria: Tamano de memoria no valido: ' + str(sMemoria))
+    nFactor = {'' : 1 , 'K' : 1024 , 'M' : 1024**2 , 'G' : 1024**3 , 'T' : 1024**4}[m.group(2).upper()]
+    return int(float(m.group(1)) * nFactor)
+
+
+def formatoMemoria(nBytes):
+    """
+     Regresa el tamano 'nBytes' en texto, por ejemplo '3.2G'
+    """
+    for sUnidad, nFactor in [('T',1024**4),('G',1024**3),('M',1024**2),('K',1024)]:
+        if nBytes >= nFactor:
+            return '%.1f%s' % (float(nBytes)/nFactor, sUnidad)
+    return str(int(nBytes))
+
+
+def tamanosCorrida(dataSourceFile, sMaskFile, iEastIndex, iSouthIndex):
+    """
+     Lee las dimensiones del archivo fuente y de la mascara, y el chunking de las variables
+     del archivo fuente. Regresa <python dict> con los tamanos en bytes:
+      'nRecords'   : Registros temporales del archivo fuente.
+      'nTimeChunkFuente' : Tamano del chunk temporal de las variables del archivo fuente (1 si no tienen chunks).
+      'nPorRegistro' : Memoria por registro temporal en un bloque (arreglos interpolados y bloques leidos).
+      'nFijo'      : Memoria que no depende del bloque (mascara).
+      'nCachePorFila' : Bytes de cache de chunks por fila de prefetch (todas las variables), 0 si no tienen chunks.
+    """
+    ncMask = nc.Dataset(sMaskFile,'r')
+    ncMaskLat = ncMask.variables['nav_lat'][:]
+    ncMaskLon = ncMask.variables['nav_lon'][:]
+    ncMaskDepth = ncMask.variables['nav_lev'][:]
+    nMaskDepth = ncMaskDepth.size
+    tmask = ncMask.variables['tmask']
+    # Coordenadas de la malla y mascara de las fronteras (ver obc_creator.cargarMascara)
+    nFijo = tmask.shape[1] * (tmask.shape[2] + tmask.shape[3]) * tmask.dtype.itemsize + ncMaskLat.nbytes + ncMaskLon.nbytes
+    nEast = ncMaskLat.shape[0]
+    nSouth = ncMaskLat.shape[1]
+    ncMask.close()
+
+    ncMer = nc.Dataset(dataSourceFile,'r')
+    ncMerLat = ncMer.variables['latitude'][:]
+    ncMerLon = ncMer.variables['longitude'][:]
+    nRecords = ncMer.variables['time_counter'].size
+    ncMerDepth = ncMer.variables['depth'][:]
+    dLoc = obc_creator.localizarFronteras(ncMerLat,ncMerLon,ncMerDepth,ncMaskLat,ncMaskLon,ncMaskDepth,iEastIndex,iSouthIndex)
+    dRegiones = {'east' : dLoc['east'].regiones , 'south' : dLoc['south'].regiones}
+
+    # Elementos de un registro de las tiras leidas del archivo fuente. interpolarBloque mantiene vivos
+    # los bloques este y sur de la variable anterior mientras lee los de la siguiente, y 'leer' concatena
+    # las tiras del bloque que se esta leyendo (una copia mas de ese bloque).
+    nRegionEast = int(np.prod(dLoc['east'].shapeRegion))
+    nRegionSouth = int(np.prod(dLoc['south'].shapeRegion))
+    nElementosLectura = 2 * (nRegionEast + nRegionSouth) + max(nRegionEast, nRegionSouth)
+    nLocalizador = max(dLoc['east'].bytesPorRegistro(), dLoc['south'].bytesPorRegistro())
+    nLectura = 0
+    nCachePorFila = 0
+    nTimeChunkFuente = 1
+    for sVar in VARIABLES_FUENTE:
+        ncVar = ncMer.variables[sVar]
+        # Bloques leidos (masked array: datos y mascara), las variables empacadas (scale_factor,
+        # add_offset) se leen como float64. La copia de la conversion de temperatura se hace con solo
+        # los bloques de esa variable vivos, cabe en la copia de la concatenacion.
+        nItemsize = 8 if ('scale_factor' in ncVar.ncattrs() or 'add_offset' in ncVar.ncattrs()) else ncVar.dtype.itemsize
+        nLectura = max(nLectura, nElementosLectura * (nItemsize + 1))
+        nChunks = obc_creator.chunksEnRegiones(ncVar, dRegiones)
+        if nChunks > 0:
+            chunking = ncVar.chunking()
+            nCachePorFila = nCachePorFila + nChunks * int(np.prod(chunking)) * ncVar.dtype.itemsize
+            nTimeChunkFuente = max(nTimeChunkFuente, chunking[0])
+    ncMer.close()
+
+    dTamanos = {}
+    dTamanos['nRecords'] = nRecords
+    dTamanos['nTimeChunkFuente'] = nTimeChunkFuente
+    # 8 arreglos float64 interpolados (4 variables, frontera este y sur), el bloque leido y los 
+    # temporales del localizador
+    dTamanos['nPorRegistro'] = len(VARIABLES_FUENTE) * 2 * nMaskDepth * (nEast + nSouth) * 8 + nLectura + nLocalizador
+    dTamanos['nFijo'] = nFijo
+    dTamanos['nCachePorFila'] = nCachePorFila
+    return dTamanos
+
+
+def picoProceso(dTamanos, nTimeChunk, nPrefetch):
+    """
+     Estimacion del pico de memoria de un proceso, con bloques de 'nTimeChunk' registros
+     (mas los 2 registros de borde) y 'nPrefetch' filas de cache.
+    """
+    return BASE_PROCESO + dTamanos['nFijo'] + nPrefetch * dTamanos['nCachePorFila'] + (nTimeChunk + 2) * dTamanos['nPorRegistro']
+
+
+def planificarCorrida(dataSourceFile, sMaskFile, iEastIndex, iSouthIndex, nMaxMemory, lShardRecords=None, nMaxWorkers=None, bProcesoPadre=True):
+    """
+     Elige el tamano de bloque temporal, la profundidad de prefetch y el numero de procesos
+     para que el pico de memoria estimado de la corrida no pase de 'nMaxMemory' bytes.
+      lShardRecords : Numero de registros de cada shard (ver obc_parallel.py), None para una sola corrida
+                      con todos los registros del archivo fuente.
+      nMaxWorkers   : Maximo de procesos, None utiliza el numero de procesadores.
+      bProcesoPadre : Los procesos los inicia un proceso padre (obc_parallel.py correr), que tambien
+                      carga las librerias y ocupa BASE_PROCESO del limite. False cuando el unico proceso
+                      es el que interpola (obc_parallel.py shard).
+     Regresa <python dict> : { 'nTimeChunk' , 'nPrefetch' , 'nWorkers' , 'nPicoProceso' , 'nPico' }
+     'nPico' incluye al proceso padre. Lanza ValueError si ni un solo proceso con bloques de 1 registro
+     (mas el proceso padre) cabe en 'nMaxMemory'.
+    """
+    dTamanos = tamanosCorrida(dataSourceFile, sMaskFile, iEastIndex, iSouthIndex)
+    if lShardRecords == None or len(lShardRecords) == 0:
+        lShardRecords = [dTamanos['nRecords']]
+    nShardMax = max(lShardRecords)
+    if nMaxWorkers == None:
+        nMaxWorkers = multiprocessing.cpu_count()
+    nPrefetchMin = 1 if dTamanos['nCachePorFila'] > 0 else 0
+
+    # Memoria del proceso padre, fuera de la disponible para los procesos que interpolan
+    nPadre = BASE_PROCESO if bProcesoPadre else 0
+    nMemoriaProcesos = nMaxMemory - nPadre
+
+    if picoProceso(dTamanos, 1, nPrefetchMin) > nMemoriaProcesos:
+        raise ValueError('planificarCorrida: El limite de memoria ' + formatoMemoria(nMaxMemory) + ' es menor al minimo de un proceso: '
+                         + formatoMemoria(picoProceso(dTamanos, 1, nPrefetchMin) + nPadre))
+
+    # Procesos: los que quepan con bloques del tamano del chunk temporal del archivo fuente (o del shard mas largo).
+    nTimeChunkMin = min(dTamanos['nTimeChunkFuente'], nShardMax)
+    nWorkers = int(nMemoriaProcesos // picoProceso(dTamanos, nTimeChunkMin, nPrefetchMin))
+    nWorkers = max(1, min(nWorkers, nMaxWorkers, len(lShardRecords)))
+    nMemoriaProceso = nMemoriaProcesos // nWorkers
+
+    # Prefetch: 2 filas de chunks si caben, para bloques que no coinciden con los chunks del archivo fuente.
+    nPrefetch = nPrefetchMin
+    if nPrefetchMin > 0 and picoProceso(dTamanos, nTimeChunkMin, 2) <= nMemoriaProceso:
+        nPrefetch = 2
+
+    # Bloque temporal: el mas grande que quepa en la memoria del proceso, alineado al chunk temporal del archivo fuente.
+    nTimeChunk = int((nMemoriaProceso - picoProceso(dTamanos, 0, nPrefetch)) // dTamanos['nPorRegistro'])
+    nTimeChunk = max(1, min(nTimeChunk, nShardMax))
+    if nTimeChunk < nShardMax and nTimeChunk >= dTamanos['nTimeChunkFuente']:
+        nTimeChunk = nTimeChunk - (nTimeChunk % dTamanos['nTimeChunkFuente'])
+
+    dPlan = {}
+    dPlan['nTimeChunk'] = nTimeChunk
+    dPlan['nPrefetch'] = nPrefetch
+    dPlan['nWorkers'] = nWorkers
+    dPlan['nPicoProceso'] = picoProceso(dTamanos, nTimeChunk, nPrefetch)
+    dPlan['nPico'] = nPadre + nWorkers * dPlan['nPicoProceso']
+
+    log.info('Plan de memoria, limite: ' + formatoMemoria(nMaxMemory))
+    log.info('  Registros: ' + str(dTamanos['nRecords']) + '  Shards: ' + str(len(lShardRecords)) + '  Chunk temporal fuente: ' + str(dTamanos['nTimeChunkFuente']))
+    log.info('  Memoria por registro: ' + formatoMemoria(dTamanos['nPorRegistro']) + '  Cache por fila: ' + formatoMemoria(dTamanos['nCachePorFila']))
+    log.info('  nTimeChunk: ' + str(nTimeChunk) + '  nPrefetch: ' + str(nPrefetch) + '  nWorkers: ' + str(nWorkers))
+    log.info('  Pico estimado: ' + formatoMemoria(dPlan['nPico']) + ' (' + formatoMemoria(dPlan['nPicoProceso']) + ' por proceso, ' + formatoMemoria(nPadre) + ' proceso padre)')
+    return dPlan
@@ -0,0 +1,280 @@
+"""
+ Driver para crear los archivos OBC por periodos (anuales o mensuales) en paralelo.
+
+ Los archivos de cada periodo son independientes entre si, salvo por los registros de borde
+ (indices -1 y +1 del periodo) que se toman de los periodos vecinos. El driver divide los
+ registros temporales del archivo fuente en 'shards', uno por periodo mas sus registros de borde,
+ y los guarda en un manifiesto JSON. Cada shard se procesa con crearFronterasEsteSur en un
+ proceso independiente que escribe directamente los archivos de su periodo.
+
+ Uso:
+  Crear el manifiesto:
+   python obc_parallel.py crear fuente.nc GOLFO24_mask.nc 428 1 obc_GOLFO24 manifiesto.json --size yearly
+  Correr todos los shards en procesos locales:
+   python obc_parallel.py correr manifiesto.json --workers 8
+  Con un limite de memoria, el numero de procesos y el tamano de los bloques se eligen con obc_memory.py:
+   python obc_parallel.py correr manifiesto.json --max-memory 4G
+  Correr un solo shard (por ejemplo desde un trabajo batch en otro nodo):
+   python obc_parallel.py shard manifiesto.json 3
+"""
+
+import os
+import sys
+import json
+import time
+import argparse
+import multiprocessing
+import logging as log
+import netCDF4 as nc
+# own libs
+import obc_creator
+import obc_memory
+
+# Version 2: nRecords, tamano y fecha de modificacion del archivo fuente, para validar los shards
+MANIFEST_VERSION = 2
+# Segundos entre revisiones de los procesos de los shards
+INTERVALO_REVISION = 1.0
+
+
+def calcularShards(dataSourceFile, sFilesSize='yearly'):
+    """
+     Agrupa los registros temporales del archivo fuente por periodo de salida.
+     Regresa una lista <python list> con un diccionario por periodo:
+      { 'periodo' : 'y2014m00' , 'iTimeRange' : [primero,ultimo] }
+     Donde 'iTimeRange' incluye el registro anterior y el posterior al periodo (si existen),
+     necesarios para los indices -1 y +1 de los archivos OBC. 'ultimo' no incluido.
+    """
+    ncMer = nc.Dataset(dataSourceFile,'r')
+    ncMerTime = ncMer.variables['time_counter']
+    dates = nc.num2date(ncMerTime[:],ncMerTime.units,ncMerTime.calendar)
+    ncMer.close()
+
+    lShards = []
+    for idx,tval_datetime in enumerate(dates):
+        sPeriodo = obc_creator.clavePeriodo(tval_datetime,sFilesSize)
+        if len(lShards) == 0 or lShards[-1]['periodo'] != sPeriodo:
+            lShards.append({'periodo' : sPeriodo , 'iTimeRange' : [idx, idx+1]})
+        else:
+            lShards[-1]['iTimeRange'][1] = idx + 1
+    # Agregar los registros de borde
+    for s in lShards:
+        s['iTimeRange'] = [max(s['iTimeRange'][0]-1, 0) , min(s['iTimeRange'][1]+1, len(dates))]
+    return lShards
+
+
+def _registrosFuente(dataSourceFile):
+    """
+     Numero de registros temporales del archivo fuente.
+    """
+    ncMer = nc.Dataset(dataSourceFile,'r')
+    nRecords = ncMer.variables['time_counter'].size
+    ncMer.close()
+    return nRecords
+
+
+def crearManifiesto(dataSourceFile, sMaskFile, iEastIndex, iSouthIndex, fileOutPrefix, sManifestFile, sFilesSize='yearly'):
+    """
+     Crea el manifiesto JSON con los parametros de la corrida y los shards por periodo.
+     Las rutas se guardan absolutas, para que los shards se puedan correr desde otro directorio
+     u otro nodo con el mismo sistema de archivos. Se guardan tambien el numero de registros, el tamano
+     y la fecha de modificacion del archivo fuente (ver verificarShard).
+    """
+    dManifest = {}
+    dManifest['version'] = MANIFEST_VERSION
+    dManifest['dataSourceFile'] = os.path.abspath(dataSourceFile)
+    dManifest['sMaskFile'] = os.path.abspath(sMaskFile)
+    dManifest['iEastIndex'] = int(iEastIndex)
+    dManifest['iSouthIndex'] = int(iSouthIndex)
+    dManifest['fileOutPrefix'] = os.path.abspath(fileOutPrefix)
+    dManifest['sFilesSize'] = sFilesSize
+    dManifest['nRecords'] = _registrosFuente(dataSourceFile)
+    dManifest['sourceSize'] = os.path.getsize(dataSourceFile)
+    dManifest['sourceMtime'] = int(os.path.getmtime(dataSourceFile))
+    dManifest['shards'] = calcularShards(dataSourceFile,sFilesSize)
+
+    fManifest = open(sManifestFile,'w')
+    json.dump(dManifest,fManifest,indent=1)
+    fManifest.close()
+    log.info('Manifiesto ' + sManifestFile + ' creado con ' + str(len(dManifest['shards'])) + ' shards.')
+    return dManifest
+
+
+def leerManifiesto(sManifestFile):
+    """
+     Lee el manifiesto JSON creado con crearManifiesto.
+    """
+    fManifest = open(sManifestFile,'r')
+    dManifest = json.load(fManifest)
+    fManifest.close()
+    if dManifest.get('version') != MANIFEST_VERSION:
+        raise ValueError('leerManifiesto: Version de manifiesto no soportada: ' + str(dManifest.get('version')))
+    return dManifest
+
+
+def verificarShard(dManifest, iShard):
+    """
+     Revisa que el shard 'iShard' corresponda al archivo fuente actual, que pudo cambiar despues de
+     crear el manifiesto (por ejemplo si se volvio a descargar). Lanza ValueError si:
+      - El archivo fuente no tiene el tamano, fecha de modificacion o numero de registros del manifiesto.
+      - 'iTimeRange' esta fuera de los registros del archivo fuente.
+      - Los registros de 'iTimeRange', sin los de borde, no son todos del periodo del shard, o los
+        registros de borde son del mismo periodo (el periodo tiene registros fuera del shard).
+    """
+    dShard = dManifest['shards'][iShard]
+    dataSourceFile = str(dManifest['dataSourceFile'])
+    if os.path.getsize(dataSourceFile) != dManifest['sourceSize'] or int(os.path.getmtime(dataSourceFile)) != dManifest['sourceMtime']:
+        raise ValueError('verificarShard: El archivo fuente cambio despues de crear el manifiesto: ' + dataSourceFile)
+    ncMer = nc.Dataset(dataSourceFile,'r')
+    ncMerTime = ncMer.variables['time_counter']
+    nRecords = ncMerTime.size
+    iFirst, iLast = dShard['iTimeRange']
+    if nRecords != dManifest['nRecords']:
+        ncMer.close()
+        raise ValueError('verificarShard: El archivo fuente tiene ' + str(nRecords) + ' registros, el manifiesto ' + str(dManifest['nRecords']))
+    if iFirst < 0 or iLast > nRecords or iFirst >= iLast:
+        ncMer.close()
+        raise ValueError('verificarShard: Rango ' + str(dShard['iTimeRange']) + ' del shard ' + str(iShard) +
+                         ' fuera de los ' + str(nRecords) + ' registros del archivo fuente')
+    dates = nc.num2date(ncMerTime[iFirst:iLast],ncMerTime.units,ncMerTime.calendar)
+    ncMer.close()
+
+    lPeriodos = [obc_creator.clavePeriodo(tval_datetime,str(dManifest['sFilesSize'])) for tval_datetime in dates]
+    # Registros de borde: el primero y el ultimo, salvo en los extremos del archivo fuente
+    iPrimero = 1 if iFirst > 0 else 0
+    iUltimo = len(lPeriodos) - 1 if iLast < nRecords else len(lPeriodos)
+    lInterior = lPeriodos[iPrimero:iUltimo]
+    lBorde = lPeriodos[:iPrimero] + lPeriodos[iUltimo:]
+    if len(lInterior) == 0 or lInterior.count(dShard['periodo']) != len(lInterior) or dShard['periodo'] in lBorde:
+        raise ValueError('verificarShard: Los registros ' + str(dShard['iTimeRange']) + ' del archivo fuente no corresponden al periodo ' +
+                         str(dShard['periodo']) + ' del shard ' + str(iShard))
+
+
+def correrShard(dManifest, iShard, nTimeChunk=None, nPrefetch=0):
+    """
+     Crea los archivos OBC del shard 'iShard' del manifiesto.
+     nTimeChunk y nPrefetch se pasan a crearFronterasEsteSur (ver obc_memory.py)
+     Lanza ValueError si el shard no corresponde al archivo fuente (ver verificarShard), e IOError
+     si no se crearon los archivos del periodo.
+    """
+    dShard = dManifest['shards'][iShard]
+    verificarShard(dManifest, iShard)
+    log.info('Shard ' + str(iShard) + ' periodo: ' + dShard['periodo'] + ' registros: ' + str(dShard['iTimeRange']))
+    obc_creator.verificarDirectorioSalida(str(dManifest['fileOutPrefix']))
+    obc_creator.crearFronterasEsteSur(str(dManifest['dataSourceFile']), str(dManifest['sMaskFile']),
+                                      dManifest['iEastIndex'], dManifest['iSouthIndex'],
+                                      str(dManifest['fileOutPrefix']), 2, str(dManifest['sFilesSize']),
+                                      iTimeRange = tuple(dShard['iTimeRange']), sPeriodo = str(dShard['periodo']),
+                                      nTimeChunk = nTimeChunk, nPrefetch = nPrefetch)
+    obc_creator.verificarSalida(str(dManifest['fileOutPrefix']), [str(dShard['periodo'])])
+    return dShard['periodo']
+
+
+def _correrShardProceso(dManifest, iShard, nTimeChunk, nPrefetch):
+    """
+     Corre el shard en un proceso hijo, el codigo de salida indica si hubo error.
+    """
+    try:
+        correrShard(dManifest,iShard,nTimeChunk,nPrefetch)
+    except Exception, e:
+        log.warning('Fallo el shard ' + str(iShard) + ' : ' + str(e))
+        sys.exit(1)
+
+
+def planMemoria(dManifest, nMaxMemory, nMaxWorkers=None, bProcesoPadre=True):
+    """
+     Plan de memoria (ver obc_memory.planificarCorrida) para los shards del manifiesto.
+    """
+    lShardRecords = [s['iTimeRange'][1] - s['iTimeRange'][0] for s in dManifest['shards']]
+    return obc_memory.planificarCorrida(str(dManifest['dataSourceFile']), str(dManifest['sMaskFile']),
+                                        dManifest['iEastIndex'], dManifest['iSouthIndex'],
+                                        nMaxMemory, lShardRecords, nMaxWorkers, bProcesoPadre)
+
+
+def correrManifiesto(sManifestFile, nWorkers=None, nMaxMemory=None):
+    """
+     Corre todos los shards del manifiesto, cada uno en su propio proceso, con 'nWorkers' procesos
+     a la vez (None utiliza el numero de procesadores). Regresa la lista de shards que fallaron,
+     incluyendo los que terminaron por una senal (por ejemplo SIGKILL por falta de memoria).
+     Con 'nMaxMemory' (bytes), el numero de procesos (maximo 'nWorkers') y el tamano de los 
+     bloques temporales se eligen para no pasar de ese limite.
+    """
+    dManifest = leerManifiesto(sManifestFile)
+    nShards = len(dManifest['shards'])
+    nTimeChunk, nPrefetch = None, 0
+    if nMaxMemory != None:
+        dPlan = planMemoria(dManifest, nMaxMemory, nWorkers)
+        nWorkers, nTimeChunk, nPrefetch = dPlan['nWorkers'], dPlan['nTimeChunk'], dPlan['nPrefetch']
+    if nWorkers == None:
+        nWorkers = multiprocessing.cpu_count()
+    nWorkers = max(1, min(nWorkers, nShards))
+    log.info('Corriendo ' + str(nShards) + ' shards con ' + str(nWorkers) + ' procesos.')
+
+    lFallidos = []
+    lPendientes = list(range(nShards))
+    # Shards corriendo: indice -> multiprocessing.Process
+    dCorriendo = {}
+    while len(lPendientes) > 0 or len(dCorriendo) > 0:
+        while len(lPendientes) > 0 and len(dCorriendo) < nWorkers:
+            iShard = lPendientes.pop(0)
+            p = multiprocessing.Process(target=_correrShardProceso, name='shard-' + str(iShard), args=(dManifest,iShard,nTimeChunk,nPrefetch))
+            p.start()
+            dCorriendo[iShard] = p
+        time.sleep(INTERVALO_REVISION)
+        for iShard in list(dCorriendo.keys()):
+            p = dCorriendo[iShard]
+            if p.is_alive():
+                continue
+            p.join()
+            del dCorriendo[iShard]
+            sPeriodo = dManifest['shards'][iShard]['periodo']
+            if p.exitcode == 0:
+                log.info('Shard ' + str(iShard) + ' (' + sPeriodo + ') terminado.')
+            else:
+                log.warning('Shard ' + str(iShard) + ' (' + sPeriodo + ') con error, codigo de salida: ' + str(p.exitcode))
+                lFallidos.append(iShard)
+    if len(lFallidos) > 0:
+        log.warning('Shards con error: ' + str(sorted(lFallidos)))
+    return sorted(lFallidos)
+
+
+def main():
+    log.basicConfig(level=log.INFO, format='%(asctime)s %(processName)s %(levelname)s %(message)s')
+    parser = argparse.ArgumentParser(description='Creacion de archivos OBC por periodos en paralelo.')
+    subparsers = parser.add_subparsers(dest='comando')
+
+    pCrear = subparsers.add_parser('crear', help='Crear el manifiesto de shards por periodo.')
+    pCrear.add_argument('dataSourceFile')
+    pCrear.add_argument('sMaskFile')
+    pCrear.add_argument('iEastIndex', type=int)
+    pCrear.add_argument('iSouthIndex', type=int)
+    pCrear.add_argument('fileOutPrefix')
+    pCrear.add_argument('sManifestFile')
+    pCrear.add_argument('--size', dest='sFilesSize', choices=['yearly','monthly'], default='yearly')
+
+    pCorrer = subparsers.add_parser('correr', help='Correr todos los shards en procesos locales.')
+    pCorrer.add_argument('sManifestFile')
+    pCorrer.add_argument('--workers', dest='nWorkers', type=int, default=None)
+    pCorrer.add_argument('--max-memory', dest='sMaxMemory', default=None, help='Limite de memoria de la corrida, por ejemplo 4G')
+
+    pShard = subparsers.add_parser('shard', help='Correr un solo shard del manifiesto.')
+    pShard.add_argument('sManifestFile')
+    pShard.add_argument('iShard', type=int)
+    pShard.add_argument('--max-memory', dest='sMaxMemory', default=None, help='Limite de memoria del shard, por ejemplo 4G')
+
+    args = parser.parse_args()
+    if args.comando == 'crear':
+        crearManifiesto(args.dataSourceFile, args.sMaskFile, args.iEastIndex, args.iSouthIndex, args.fileOutPrefix, args.sManifestFile, args.sFilesSize)
+    elif args.comando == 'correr':
+        nMaxMemory = obc_memory.parseMemoria(args.sMaxMemory) if args.sMaxMemory != None else None
+        if len(correrManifiesto(args.sManifestFile, args.nWorkers, nMaxMemory)) > 0:
+            raise SystemExit(1)
+    elif args.comando == 'shard':
+        dManifest = leerManifiesto(args.sManifestFile)
+        if args.sMaxMemory != None:
+            dPlan = planMemoria(dManifest, obc_memory.parseMemoria(args.sMaxMemory), 1, False)
+            correrShard(dManifest, args.iShard, dPlan['nTimeChunk'], dPlan['nPrefetch'])
+        else:
+            correrShard(dManifest, args.iShard)
+
+if __name__ == "__main__":
+    main()
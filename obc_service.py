@@ -0,0 +1,377 @@
+"""
+ Servicio (daemon) local para crear archivos OBC con las mascaras y localizadores de fronteras
+ en memoria.
+
+ El servicio carga una sola vez las librerias (numpy, scipy, netCDF4), y guarda en memoria las
+ mascaras (ver obc_creator.cargarMascara) y los localizadores de fronteras (ver obc_creator.localizarFronteras)
+ de cada configuracion (GOLFO12, GOLFO24 ...). Los trabajos se reciben en un directorio spool, y cada
+ uno se corre en un proceso hijo (fork) que hereda el estado ya calculado, hasta 'nWorkers' a la vez.
+
+ Directorio spool:
+  nuevos/     Trabajos por correr, un archivo JSON por trabajo.
+  corriendo/  Trabajos que se estan corriendo, con el PID del proceso hijo en <trabajo>.pid
+  hechos/     Trabajos terminados.
+  errores/    Trabajos que fallaron.
+
+ Trabajo (JSON):
+  { "dataSourceFile" : "/datos/fuente.nc" , "sMaskFile" : "/datos/GOLFO24_mask.nc" , "iEastIndex" : 428 ,
+    "iSouthIndex" : 1 , "fileOutPrefix" : "/salida/obc_GOLFO24" , "saveMethod" : 2 , "sFilesSize" : "yearly" }
+  Opcionales: "nTimeChunk", "nPrefetch"
+  Solo se acepta "saveMethod" : 2, el metodo 1 escribe archivos con nombres fijos (EastTS_OBC.nc ...) en el
+  directorio de trabajo del servicio, sin utilizar 'fileOutPrefix'.
+
+ Uso:
+  Iniciar el servicio:
+   python obc_service.py servir /var/spool/obc --workers 4
+  Enviar un trabajo:
+   python obc_service.py enviar /var/spool/obc fuente.nc GOLFO24_mask.nc 428 1 obc_GOLFO24 --size yearly
+"""
+
+import os
+import sys
+import json
+import time
+import errno
+import signal
+import hashlib
+import tempfile
+import argparse
+import collections
+import traceback
+import multiprocessing
+import logging as log
+import numpy as np
+import netCDF4 as nc
+# own libs
+import obc_creator
+
+SPOOL_DIRS = ['nuevos','corriendo','hechos','errores']
+# Metodos de salida de crearFronterasEsteSur que acepta el servicio
+SAVE_METHODS = [2]
+# Segundos entre revisiones del archivo .pid en el proceso hijo, antes de iniciar el trabajo
+INTERVALO_PID = 0.05
+# Localizadores que se mantienen en memoria por mascara, de las ultimas mallas (recortes) del archivo fuente
+MAX_MALLAS_POR_MASCARA = 4
+
+
+def enviarTrabajo(sSpoolDir, dataSourceFile, sMaskFile, iEastIndex, iSouthIndex, fileOutPrefix, saveMethod=2, sFilesSize='yearly'):
+    """
+     Escribe un trabajo en el directorio 'nuevos' del spool. El archivo se escribe con un nombre temporal
+     unico y despues se enlaza con su nombre final, para que el servicio nunca lea un trabajo incompleto
+     y nunca se reemplace un trabajo con el mismo nombre.
+     Las rutas se guardan absolutas. Regresa el nombre del trabajo.
+    """
+    if int(saveMethod) not in SAVE_METHODS:
+        raise ValueError('enviarTrabajo: saveMethod no soportado por el servicio: ' + str(saveMethod))
+    dTrabajo = {}
+    dTrabajo['dataSourceFile'] = os.path.abspath(dataSourceFile)
+    dTrabajo['sMaskFile'] = os.path.abspath(sMaskFile)
+    dTrabajo['iEastIndex'] = int(iEastIndex)
+    dTrabajo['iSouthIndex'] = int(iSouthIndex)
+    dTrabajo['fileOutPrefix'] = os.path.abspath(fileOutPrefix)
+    dTrabajo['saveMethod'] = int(saveMethod)
+    dTrabajo['sFilesSize'] = sFilesSize
+
+    if not os.path.isdir(os.path.join(sSpoolDir,'nuevos')):
+        os.makedirs(os.path.join(sSpoolDir,'nuevos'))
+    fd, sTmp = tempfile.mkstemp(suffix='.tmp', prefix='.', dir=os.path.join(sSpoolDir,'nuevos'))
+    fTrabajo = os.fdopen(fd,'w')
+    json.dump(dTrabajo,fTrabajo,indent=1)
+    fTrabajo.close()
+    # mkstemp crea el archivo solo para el usuario, el servicio puede correr con otro usuario
+    nUmask = os.umask(0)
+    os.umask(nUmask)
+    os.chmod(sTmp, 0666 & ~nUmask)
+    # La parte aleatoria del nombre temporal hace unico el nombre del trabajo, os.link falla si ya existe
+    sBase = time.strftime('%Y%m%d%H%M%S') + '_' + str(os.getpid()) + '_' + os.path.basename(sTmp)[1:-4] + '_' + os.path.basename(fileOutPrefix)
+    sNombre = sBase + '.json'
+    nIntento = 0
+    while True:
+        try:
+            os.link(sTmp, os.path.join(sSpoolDir,'nuevos',sNombre))
+            break
+        except OSError, e:
+            if e.errno != errno.EEXIST:
+                os.remove(sTmp)
+                raise
+            nIntento = nIntento + 1
+            sNombre = sBase + '_' + str(nIntento) + '.json'
+    os.remove(sTmp)
+    return sNombre
+
+
+def _firmaArreglos(*arreglos):
+    """
+     Firma (md5) del contenido de los arreglos, para identificar la malla del archivo fuente.
+    """
+    h = hashlib.md5()
+    for a in arreglos:
+        a = np.ascontiguousarray(np.asarray(a,float))
+        h.update(str(a.shape).encode())
+        h.update(a.tobytes())
+    return h.hexdigest()
+
+
+def _procesoVivo(nPid):
+    """
+     Regresa True si existe un proceso con el PID 'nPid' (aunque sea de otro usuario).
+    """
+    try:
+        os.kill(nPid, 0)
+    except OSError, e:
+        return e.errno == errno.EPERM
+    return True
+
+
+def _escribirPid(sArchivoPid, nPid):
+    """
+     Escribe el PID en 'sArchivoPid' con otro nombre y despues lo renombra, nunca queda incompleto.
+    """
+    sTmp = sArchivoPid + '.tmp'
+    fPid = open(sTmp,'w')
+    fPid.write(str(nPid) + '\n')
+    fPid.close()
+    os.rename(sTmp, sArchivoPid)
+
+
+def _leerPid(sArchivoPid):
+    """
+     Regresa el PID de 'sArchivoPid', None si no existe o no es valido.
+    """
+    try:
+        fPid = open(sArchivoPid,'r')
+        nPid = int(fPid.read().strip())
+        fPid.close()
+    except (IOError, ValueError):
+        return None
+    return nPid
+
+
+def _correrTrabajo(sNombre, dTrabajo, dMascara, dLoc, sArchivoPid, nPidServicio):
+    """
+     Corre un trabajo en el proceso hijo, con la mascara y localizadores heredados del servicio.
+     Termina con codigo 1 si falla, o si no se crearon los archivos de todos los periodos del archivo fuente.
+    """
+    # El proceso hijo termina con las senales por omision, no con las del servicio
+    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+    signal.signal(signal.SIGINT, signal.SIG_DFL)
+    # No se escribe nada hasta que el servicio registra el PID de este proceso en 'sArchivoPid'. Si el
+    # servicio termina antes, el trabajo se corre de nuevo al reiniciarlo, y este proceso no debe escribir.
+    while _leerPid(sArchivoPid) != os.getpid():
+        if os.getppid() != nPidServicio:
+            log.warning('El servicio termino antes de registrar el trabajo ' + sNombre)
+            sys.exit(1)
+        time.sleep(INTERVALO_PID)
+    try:
+        obc_creator.verificarDirectorioSalida(str(dTrabajo['fileOutPrefix']))
+        obc_creator.crearFronterasEsteSur(str(dTrabajo['dataSourceFile']), str(dTrabajo['sMaskFile']),
+                                          dTrabajo['iEastIndex'], dTrabajo['iSouthIndex'],
+                                          str(dTrabajo['fileOutPrefix']), dTrabajo.get('saveMethod',2),
+                                          str(dTrabajo.get('sFilesSize','yearly')),
+                                          nTimeChunk = dTrabajo.get('nTimeChunk'), nPrefetch = dTrabajo.get('nPrefetch',0),
+                                          dMascara = dMascara, dLoc = dLoc)
+        obc_creator.verificarSalida(str(dTrabajo['fileOutPrefix']),
+                                    obc_creator.periodosFuente(str(dTrabajo['dataSourceFile']), str(dTrabajo.get('sFilesSize','yearly'))))
+    except Exception, e:
+        log.warning('Fallo el trabajo ' + sNombre + ' : ' + str(e))
+        log.warning(traceback.format_exc())
+        sys.exit(1)
+
+
+class servicioOBC():
+        """
+         Clase servicioOBC
+         Revisa el directorio spool cada 'fIntervalo' segundos, y corre los trabajos nuevos
+         en procesos hijos, hasta 'nWorkers' a la vez. Las mascaras y los localizadores de las
+         fronteras se calculan una vez por configuracion y se mantienen en memoria.
+        """
+
+        def __init__(self, sSpoolDir, nWorkers=None, fIntervalo=2.0, nVecinos=4, sMetodoHorizontal='nearest'):
+            self.sSpoolDir = sSpoolDir
+            self.nWorkers = nWorkers if nWorkers != None else multiprocessing.cpu_count()
+            self.fIntervalo = fIntervalo
+            self.nVecinos = nVecinos
+            self.sMetodoHorizontal = sMetodoHorizontal
+            # Cache de mascaras: (archivo, mtime, iEastIndex, iSouthIndex) -> dMascara
+            self.dMascaras = {}
+            # Cache de localizadores: (llave mascara, firma malla fuente) -> dLoc, del menos al mas reciente
+            self.dLocalizadores = collections.OrderedDict()
+            # Trabajos corriendo: nombre -> multiprocessing.Process
+            self.dCorriendo = {}
+            # Trabajos de una ejecucion anterior del servicio que siguen corriendo: nombre -> PID
+            self.dHuerfanos = {}
+            self.bDetener = False
+            for d in SPOOL_DIRS:
+                if not os.path.isdir(os.path.join(sSpoolDir,d)):
+                    os.makedirs(os.path.join(sSpoolDir,d))
+
+        def estado(self, dTrabajo):
+            """
+             Regresa la mascara y los localizadores de las fronteras del trabajo, de la cache si ya se calcularon.
+             Solo se leen las coordenadas del archivo fuente, para identificar su malla. Por cada mascara se
+             mantienen los localizadores de las ultimas MAX_MALLAS_POR_MASCARA mallas del archivo fuente.
+            """
+            sMaskFile = str(dTrabajo['sMaskFile'])
+            llaveMascara = (sMaskFile, os.path.getmtime(sMaskFile), dTrabajo['iEastIndex'], dTrabajo['iSouthIndex'])
+            if llaveMascara not in self.dMascaras:
+                log.info('Cargando mascara: ' + sMaskFile)
+                # Si el archivo de mascara cambio, se descarta lo calculado con la version anterior
+                for llave in list(self.dMascaras.keys()):
+                    if llave[0] == sMaskFile and llave[1] != llaveMascara[1]:
+                        del self.dMascaras[llave]
+                for llave in list(self.dLocalizadores.keys()):
+                    if llave[0][0] == sMaskFile and llave[0][1] != llaveMascara[1]:
+                        del self.dLocalizadores[llave]
+                self.dMascaras[llaveMascara] = obc_creator.cargarMascara(sMaskFile, dTrabajo['iEastIndex'], dTrabajo['iSouthIndex'])
+            dMascara = self.dMascaras[llaveMascara]
+
+            ncMer = nc.Dataset(str(dTrabajo['dataSourceFile']),'r')
+            ncMerLat = ncMer.variables['latitude'][:]
+            ncMerLon = ncMer.variables['longitude'][:]
+            ncMerDepth = ncMer.variables['depth'][:]
+            ncMer.close()
+            llaveLoc = (llaveMascara, _firmaArreglos(ncMerLat, ncMerLon, ncMerDepth))
+            if llaveLoc in self.dLocalizadores:
+                dLoc = self.dLocalizadores.pop(llaveLoc)
+            else:
+                log.info('Calculando localizadores de fronteras para: ' + sMaskFile)
+                dLoc = obc_creator.localizarFronteras(ncMerLat, ncMerLon, ncMerDepth,
+                                                      dMascara['nav_lat'], dMascara['nav_lon'], dMascara['nav_lev'],
+                                                      dTrabajo['iEastIndex'], dTrabajo['iSouthIndex'],
+                                                      self.nVecinos, self.sMetodoHorizontal)
+                # Descartar los localizadores de la malla usada hace mas tiempo con esta mascara
+                lMallas = [llave for llave in self.dLocalizadores.keys() if llave[0] == llaveMascara]
+                for llave in lMallas[:max(0, len(lMallas) - MAX_MALLAS_POR_MASCARA + 1)]:
+                    del self.dLocalizadores[llave]
+            self.dLocalizadores[llaveLoc] = dLoc
+            return dMascara, dLoc
+
+        def _mover(self, sNombre, sDe, sA):
+            os.rename(os.path.join(self.sSpoolDir,sDe,sNombre), os.path.join(self.sSpoolDir,sA,sNombre))
+
+        def _archivoPid(self, sNombre):
+            return os.path.join(self.sSpoolDir,'corriendo',os.path.splitext(sNombre)[0] + '.pid')
+
+        def _borrarPid(self, sNombre):
+            if os.path.exists(self._archivoPid(sNombre)):
+                os.remove(self._archivoPid(sNombre))
+
+        def iniciarTrabajo(self, sNombre):
+            """
+             Mueve el trabajo a 'corriendo' y lo inicia en un proceso hijo. Los trabajos que no se
+             pueden leer, o con un 'saveMethod' no soportado, se mueven a 'errores'.
+            """
+            self._mover(sNombre,'nuevos','corriendo')
+            try:
+                fTrabajo = open(os.path.join(self.sSpoolDir,'corriendo',sNombre),'r')
+                dTrabajo = json.load(fTrabajo)
+                fTrabajo.close()
+                if dTrabajo.get('saveMethod',2) not in SAVE_METHODS:
+                    raise ValueError('saveMethod no soportado por el servicio: ' + str(dTrabajo.get('saveMethod')))
+                dMascara, dLoc = self.estado(dTrabajo)
+            except Exception, e:
+                log.warning('Trabajo no valido ' + sNombre + ' : ' + str(e))
+                self._mover(sNombre,'corriendo','errores')
+                return
+            log.info('Iniciando trabajo: ' + sNombre)
+            p = multiprocessing.Process(target=_correrTrabajo, name=sNombre,
+                                        args=(sNombre, dTrabajo, dMascara, dLoc, self._archivoPid(sNombre), os.getpid()))
+            p.start()
+            self.dCorriendo[sNombre] = p
+            _escribirPid(self._archivoPid(sNombre), p.pid)
+
+        def revisarTerminados(self):
+            """
+             Mueve los trabajos terminados a 'hechos' o 'errores' segun el codigo de salida del proceso.
+             Los trabajos de una ejecucion anterior (sin codigo de salida) se corren de nuevo al terminar
+             su proceso.
+            """
+            for sNombre in list(self.dCorriendo.keys()):
+                p = self.dCorriendo[sNombre]
+                if p.is_alive():
+                    continue
+                p.join()
+                del self.dCorriendo[sNombre]
+                self._borrarPid(sNombre)
+                if p.exitcode == 0:
+                    log.info('Trabajo terminado: ' + sNombre)
+                    self._mover(sNombre,'corriendo','hechos')
+                else:
+                    log.warning('Trabajo con error (' + str(p.exitcode) + '): ' + sNombre)
+                    self._mover(sNombre,'corriendo','errores')
+            for sNombre in list(self.dHuerfanos.keys()):
+                if _procesoVivo(self.dHuerfanos[sNombre]):
+                    continue
+                del self.dHuerfanos[sNombre]
+                log.info('Termino el proceso de la ejecucion anterior, se corre de nuevo: ' + sNombre)
+                self._borrarPid(sNombre)
+                self._mover(sNombre,'corriendo','nuevos')
+
+        def detener(self, signum=None, frame=None):
+            """
+             Deja de iniciar trabajos nuevos, los que estan corriendo se terminan.
+            """
+            log.info('Deteniendo el servicio.')
+            self.bDetener = True
+
+        def servir(self):
+            """
+             Ciclo principal del servicio, hasta recibir SIGTERM o SIGINT.
+            """
+            signal.signal(signal.SIGTERM, self.detener)
+            signal.signal(signal.SIGINT, self.detener)
+            # Trabajos que quedaron en 'corriendo' de una ejecucion anterior se corren de nuevo, si su
+            # proceso ya no existe. Si sigue vivo, se espera a que termine (ver revisarTerminados).
+            for sNombre in os.listdir(os.path.join(self.sSpoolDir,'corriendo')):
+                if not sNombre.endswith('.json'):
+                    continue
+                nPid = _leerPid(self._archivoPid(sNombre))
+                if nPid != None and _procesoVivo(nPid):
+                    log.info('Trabajo de una ejecucion anterior sigue corriendo (PID ' + str(nPid) + '): ' + sNombre)
+                    self.dHuerfanos[sNombre] = nPid
+                else:
+                    self._borrarPid(sNombre)
+                    self._mover(sNombre,'corriendo','nuevos')
+            log.info('Servicio OBC en: ' + self.sSpoolDir + ' , procesos: ' + str(self.nWorkers))
+
+            while not self.bDetener:
+                self.revisarTerminados()
+                lNuevos = sorted([f for f in os.listdir(os.path.join(self.sSpoolDir,'nuevos')) if f.endswith('.json') and not f.startswith('.')])
+                for sNombre in lNuevos:
+                    if len(self.dCorriendo) + len(self.dHuerfanos) >= self.nWorkers or self.bDetener:
+                        break
+                    self.iniciarTrabajo(sNombre)
+                time.sleep(self.fIntervalo)
+
+            while len(self.dCorriendo) > 0:
+                self.revisarTerminados()
+                time.sleep(self.fIntervalo)
+
+
+def main():
+    log.basicConfig(level=log.INFO, format='%(asctime)s %(processName)s %(levelname)s %(message)s')
+    parser = argparse.ArgumentParser(description='Servicio local para crear archivos OBC.')
+    subparsers = parser.add_subparsers(dest='comando')
+
+    pServir = subparsers.add_parser('servir', help='Iniciar el servicio sobre un directorio spool.')
+    pServir.add_argument('sSpoolDir')
+    pServir.add_argument('--workers', dest='nWorkers', type=int, default=None)
+    pServir.add_argument('--intervalo', dest='fIntervalo', type=float, default=2.0)
+
+    pEnviar = subparsers.add_parser('enviar', help='Enviar un trabajo al servicio.')
+    pEnviar.add_argument('sSpoolDir')
+    pEnviar.add_argument('dataSourceFile')
+    pEnviar.add_argument('sMaskFile')
+    pEnviar.add_argument('iEastIndex', type=int)
+    pEnviar.add_argument('iSouthIndex', type=int)
+    pEnviar.add_argument('fileOutPrefix')
+    pEnviar.add_argument('--size', dest='sFilesSize', choices=['yearly','monthly'], default='yearly')
+
+    args = parser.parse_args()
+    if args.comando == 'servir':
+        servicioOBC(args.sSpoolDir, args.nWorkers, args.fIntervalo).servir()
+    elif args.comando == 'enviar':
+        print(enviarTrabajo(args.sSpoolDir, args.dataSourceFile, args.sMaskFile, args.iEastIndex, args.iSouthIndex, args.fileOutPrefix, 2, args.sFilesSize))
+
+if __name__ == "__main__":
+    main()